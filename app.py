@@ -1,15 +1,26 @@
 import os
-from flask import Flask, request, render_template, send_from_directory, url_for, redirect, jsonify
+from flask import Flask, request, render_template, url_for, redirect, jsonify, abort, g, Response, stream_with_context
 import uuid
+import atexit
+import threading
+import time
+import mimetypes
 import re  # Add this import
-from src.image_processing.resize import resize_image
+from src.image_processing.resize import resize_image, contact_sheet
 from src.image_processing.filters import apply_filter
+from src.image_processing.encoder import OutputEncoder
 from src.ai.model import ThumbnailModel
 from src.ai.generator import ThumbnailGenerator
-from src.utils.file_handler import load_image, save_image
+from src.ai.backbones import get_backbone
+from src.ai.model_registry import registry as model_registry
+from src.utils.embedding_store import EmbeddingStore
+from src.utils.file_handler import decode_image, content_etag, ETagIndex, FileStore, StorageCompactor, WriteBehindWriter
+from src.utils.thumbnail_variants import ThumbnailVariants
+from werkzeug.utils import safe_join
 from src.config.settings import Config
 import cv2
 import json
+import copy
 import base64
 import io
 import numpy as np
@@ -17,6 +28,11 @@ from PIL import ImageDraw, Image
 from src.ai.prompt_engine import PromptEngine
 from datetime import datetime
 from src.utils.database import ThumbnailDatabase
+from src.utils.job_queue import JobQueue, JobStore, QueueFullError
+from src.utils.result_cache import ResultCache
+from src.utils.metrics import registry as metrics_registry, timed
+from src.utils.admission import controller as admission, OverloadedError
+from contextlib import nullcontext
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
@@ -29,8 +45,15 @@ os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
 # Initialize the AI model (do this once at startup to avoid reloading)
 model = ThumbnailModel()
-model.load_model()
-generator = ThumbnailGenerator(model)
+if Config.PRELOAD_MODELS:
+    model.load_model()
+# Each backbone has its own vector size, so each gets its own store
+backbone = get_backbone(Config.FEATURE_BACKBONE)
+embedding_store = None
+if backbone is not None:
+    embedding_store = EmbeddingStore(os.path.join(Config.EMBEDDING_STORE_PATH, backbone.name),
+                                     dim=backbone.dim, shard_rows=Config.EMBEDDING_SHARD_ROWS)
+generator = ThumbnailGenerator(model, embedding_store)
 
 # Initialize the prompt engine alongside your model
 prompt_engine = PromptEngine()
@@ -38,6 +61,161 @@ prompt_engine = PromptEngine()
 # Initialize the database
 thumbnail_db = ThumbnailDatabase()
 
+# Set once warm_up() has run; the /ready probe reports it
+readiness = threading.Event()
+
+# Uploads and outputs are persisted off the request path
+file_writer = WriteBehindWriter(max_queue=Config.WRITE_BEHIND_QUEUE_SIZE,
+                                batch_size=Config.WRITE_BEHIND_BATCH_SIZE)
+atexit.register(file_writer.close)
+etag_index = ETagIndex()
+
+# Uploads are stored once per distinct content; both folders are sharded by filename hash
+upload_store = FileStore(app.config['UPLOAD_FOLDER'], file_writer,
+                         ttl=Config.UPLOAD_RETENTION_SECONDS, max_bytes=Config.UPLOAD_STORAGE_MAX_BYTES)
+thumbnail_store = FileStore(app.config['OUTPUT_FOLDER'], file_writer,
+                            ttl=Config.THUMBNAIL_RETENTION_SECONDS, max_bytes=Config.THUMBNAIL_STORAGE_MAX_BYTES)
+
+# Thumbnails are encoded at the lowest quality meeting the PSNR target and size limit
+output_encoder = OutputEncoder(Config.OUTPUT_FORMAT,
+                               max_bytes=Config.OUTPUT_MAX_BYTES,
+                               min_psnr=Config.OUTPUT_MIN_PSNR,
+                               quality_range=Config.OUTPUT_QUALITY_RANGE)
+
+# Smaller copies of each thumbnail for dashboards and mobile
+thumbnail_variants = ThumbnailVariants(thumbnail_store, Config.THUMBNAIL_VARIANTS, encoder=output_encoder)
+
+
+def referenced_files():
+    """Files recorded in the thumbnail database, which retention must keep"""
+    uploads, thumbnails = set(), set()
+    for original_path, thumbnail_path in thumbnail_db.stored_paths():
+        if original_path:
+            uploads.add(os.path.basename(original_path))
+        if thumbnail_path:
+            thumbnail_filename = os.path.basename(thumbnail_path)
+            thumbnails.add(thumbnail_filename)
+            thumbnails.update(thumbnail_variants.variant_filenames(thumbnail_filename))
+    return {upload_store: uploads, thumbnail_store: thumbnails}
+
+
+# Retention and sharding of old files run in the background
+storage_compactor = StorageCompactor([upload_store, thumbnail_store], referenced_files,
+                                     interval=Config.STORAGE_COMPACTION_INTERVAL,
+                                     lock_path=Config.STORAGE_COMPACTION_LOCK)
+
+# Cache of generated thumbnails keyed by image content and settings
+result_cache = ResultCache(Config.RESULT_CACHE_PATH,
+                           max_memory_bytes=Config.RESULT_CACHE_MEMORY_BYTES,
+                           max_disk_bytes=Config.RESULT_CACHE_DISK_BYTES)
+
+# Concurrency limits so a burst of requests queues briefly or gets a 429 instead of thrashing
+admission.configure(Config.STAGE_LIMITS, timeout=Config.STAGE_WAIT_TIMEOUT)
+
+# Background workers for CPU-heavy generation so request threads stay free; job state is
+# shared through SQLite so a poll that reaches another server worker can still answer it
+job_queue = JobQueue(max_workers=Config.JOB_WORKERS,
+                     max_pending=Config.JOB_QUEUE_SIZE,
+                     result_ttl=Config.JOB_RESULT_TTL,
+                     store=JobStore(Config.JOB_STORE_PATH))
+
+# Scrape-time gauges for queues and the result cache
+metrics_registry.gauge('thumbnail_job_queue_depth', 'Generation jobs waiting or running',
+                       lambda: {(state,): count for state, count in job_queue.depth().items()}, ['state'])
+metrics_registry.gauge('thumbnail_write_behind_queue_depth', 'Files waiting to be written to disk',
+                       file_writer.depth)
+metrics_registry.callback_counter('thumbnail_result_cache_lookups_total', 'Result cache lookups by outcome',
+                                  lambda: {(outcome,): result_cache.stats()[outcome]
+                                           for outcome in ('memory_hits', 'disk_hits', 'misses', 'coalesced')},
+                                  ['outcome'])
+metrics_registry.gauge('thumbnail_result_cache_hit_rate', 'Fraction of result cache lookups that hit',
+                       lambda: result_cache.stats()['hit_rate'])
+metrics_registry.gauge('thumbnail_result_cache_bytes', 'Size of each result cache tier',
+                       lambda: {('memory',): result_cache.stats()['memory_bytes'],
+                                ('disk',): result_cache.stats()['disk_bytes']}, ['tier'])
+metrics_registry.gauge('thumbnail_stage_waiting', 'Requests waiting for a slot in a limited stage',
+                       lambda: {(stage,): stats['waiting'] for stage, stats in admission.stats().items()}, ['stage'])
+metrics_registry.gauge('thumbnail_stage_active', 'Requests running a limited stage',
+                       lambda: {(stage,): stats['active'] for stage, stats in admission.stats().items()}, ['stage'])
+metrics_registry.callback_counter('thumbnail_stage_rejections_total', 'Requests rejected because a stage was full',
+                                  lambda: {(stage,): stats['rejected'] for stage, stats in admission.stats().items()},
+                                  ['stage'])
+metrics_registry.gauge('thumbnail_model_bytes', 'Weight memory of each model loaded in this process',
+                       lambda: {(name,): stats['bytes'] for name, stats in model_registry.stats().items()
+                                if stats.get('bytes') is not None}, ['model'])
+request_seconds = metrics_registry.histogram('thumbnail_request_seconds', 'HTTP request latency by endpoint',
+                                             ['endpoint'])
+
+
+@app.errorhandler(OverloadedError)
+def overloaded(e):
+    response = jsonify({'error': str(e), 'stage': e.stage})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_time(response):
+    if 'request_start' in g:
+        request_seconds.observe(time.perf_counter() - g.request_start,
+                                endpoint=request.endpoint or 'unknown')
+    return response
+
+
+def warm_up():
+    """Run one generation end to end so the first real request is not slow, then report ready"""
+    start = time.perf_counter()
+    # Without PRELOAD_MODELS this is where a worker loads its models
+    model.load_model()
+    blank = Image.new('RGB', Config.IMAGE_SIZE, color=(128, 128, 128))
+    generator.generate_thumbnail(blank, prompt_engine.analyze_prompt('warm up "READY"'))
+    print(f"Warm-up finished in {time.perf_counter() - start:.2f}s (pid {os.getpid()})")
+    readiness.set()
+
+
+def preview_data_uri(image, max_size=Config.PROGRESS_PREVIEW_SIZE):
+    """Encode a small JPEG preview of an image as a data URI"""
+    preview = image.convert('RGB')
+    preview.thumbnail(max_size)
+    buffered = io.BytesIO()
+    preview.save(buffered, format="JPEG", quality=70)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffered.getvalue()).decode()
+
+
+def store_upload(file):
+    """Read an upload into memory and queue the original for write-behind persistence"""
+    image_bytes = file.read()
+    
+    # The filename comes from the content, so re-uploads of the same image share one file
+    unique_filename = upload_store.store_content(image_bytes, os.path.splitext(file.filename)[1])
+    return unique_filename, image_bytes
+
+
+def upload_hash(unique_filename):
+    """Content hash of a stored upload, taken from its content-derived filename"""
+    return os.path.splitext(unique_filename)[0]
+
+
+def save_thumbnail(thumbnail, prefix, with_variants=True):
+    """Encode a generated thumbnail and its variants and queue them for writing
+
+    Returns the output filename and the encoding parameters that were chosen.
+    """
+    # Uploads are deduplicated, so thumbnails get their own unique names
+    output_filename = f'{prefix}_{uuid.uuid4()}{output_encoder.extension}'
+    with timed('encode'):
+        data, encoding = output_encoder.encode(thumbnail)
+    thumbnail_store.write_bytes(output_filename, data)
+    if with_variants:
+        # Variants reuse the thumbnail's quality rather than searching again on the request thread
+        thumbnail_variants.save(thumbnail, output_filename, encoding)
+    return output_filename, encoding
+
 
 def allowed_file(filename):
     """Check if uploaded file has an allowed extension"""
@@ -61,10 +239,7 @@ def generate_thumbnail():
         return redirect(request.url)
     
     if file and allowed_file(file.filename):
-        # Generate a unique filename to avoid collisions
-        unique_filename = str(uuid.uuid4()) + os.path.splitext(file.filename)[1]
-        upload_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(upload_path)
+        unique_filename, image_bytes = store_upload(file)
         
         # Get filter and text from form
         filter_type = request.form.get('filter', 'SHARPEN')
@@ -80,10 +255,6 @@ def generate_thumbnail():
             print(f"Analyzed prompt: {json.dumps(thumbnail_properties, indent=2)}")
         
         try:
-            # Process the image
-            image = load_image(upload_path)
-            resized_image = resize_image(image, Config.IMAGE_SIZE)
-            
             # Use filter from prompt if available, otherwise use form input
             if thumbnail_properties and "style" in thumbnail_properties:
                 if thumbnail_properties["style"] == "gaming":
@@ -97,10 +268,24 @@ def generate_thumbnail():
             else:
                 filter_type = request.form.get('filter', 'SHARPEN')
                 
-            filtered_image = apply_filter(resized_image, filter_type)
+            def compute():
+                # Process the image
+                with timed('decode'):
+                    image = decode_image(image_bytes)
+                with timed('resize'):
+                    resized_image = resize_image(image, Config.IMAGE_SIZE)
+                with timed('filter'):
+                    filtered_image = apply_filter(resized_image, filter_type)
+                
+                # Generate thumbnail using AI
+                return generator.generate_thumbnail(filtered_image, thumbnail_properties,
+                                                    content_hash=upload_hash(unique_filename))
             
-            # Generate thumbnail using AI
-            thumbnail = generator.generate_thumbnail(filtered_image, thumbnail_properties)
+            # Reuse an earlier result for the same image and settings
+            template_name = generator.select_template(thumbnail_properties)['name']
+            cache_key = result_cache.make_key(image_bytes, thumbnail_properties, filter_type, template_name,
+                                              generator.templates.version(template_name))
+            thumbnail = result_cache.get_or_compute(cache_key, compute)
             
             # Add text from prompt if available, otherwise use form input
             text_overlay = ""
@@ -162,21 +347,82 @@ def generate_thumbnail():
                 draw.text(position, text_overlay, font=font, fill="white")
             
             # Save the generated thumbnail
-            output_filename = f'thumbnail_{unique_filename}'
-            output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
-            save_image(thumbnail, output_path)
+            output_filename, _ = save_thumbnail(thumbnail, 'thumbnail')
             
             # Return results page
             return render_template('result.html', 
                                 original_image=f'/uploads/{unique_filename}',
                                 thumbnail_image=f'/thumbnails/{output_filename}')
             
+        except OverloadedError as e:
+            return render_template('error.html', error=str(e)), 429, {'Retry-After': str(e.retry_after)}
         except Exception as e:
             return render_template('error.html', error=str(e))
     
     return redirect(url_for('index'))
 
 
+def run_prompt_pipeline(image_bytes, unique_filename, prompt, thumbnail_properties, job=None, finalize=False):
+    """Generate, save and record a thumbnail for an uploaded image and analyzed prompt
+
+    With finalize, thumbnail_properties come from /preview and the thumbnail
+    is rendered through generator.finalize with the template they pinned.
+    """
+    stage = job.stage if job else (lambda name: nullcontext())
+    
+    def report_progress(name, image=None):
+        # Stream stage events, with a small preview where there is an image to show
+        data = {'stage': name}
+        if image is not None:
+            data['preview'] = preview_data_uri(image)
+        job.emit('stage', data)
+    
+    def compute():
+        # Decode and process the image
+        with stage('load'):
+            with timed('decode'):
+                image = decode_image(image_bytes)
+            with timed('resize'):
+                resized_image = resize_image(image.convert('RGB'), Config.IMAGE_SIZE)
+        
+        # Generate thumbnail using AI with prompt properties
+        # Note: the background removal and positioning will be handled by the generator
+        with stage('generate'):
+            render = generator.finalize if finalize else generator.generate_thumbnail
+            return render(resized_image, thumbnail_properties, progress=report_progress if job else None,
+                          content_hash=upload_hash(unique_filename))
+    
+    template_name = generator.select_template(thumbnail_properties)['name']
+    cache_key = result_cache.make_key(image_bytes, thumbnail_properties, template_name=template_name,
+                                      template_version=generator.templates.version(template_name))
+    thumbnail = result_cache.get_or_compute(cache_key, compute)
+    
+    # Save the generated thumbnail
+    with stage('save'):
+        output_filename, encoding = save_thumbnail(thumbnail, 'ai_thumbnail')
+    
+    # Save to database
+    thumbnail_id = str(uuid.uuid4())
+    with stage('database'), timed('database'):
+        thumbnail_db.save_thumbnail(
+            thumbnail_id=thumbnail_id,
+            original_path=f'/uploads/{unique_filename}',
+            thumbnail_path=f'/thumbnails/{output_filename}',
+            prompt=prompt,
+            properties=thumbnail_properties
+        )
+    
+    # Return the paths and thumbnail ID
+    return {
+        'success': True,
+        'thumbnail_id': thumbnail_id,
+        'original_image': f'/uploads/{unique_filename}',
+        'thumbnail_image': f'/thumbnails/{output_filename}',
+        'encoding': encoding,
+        'properties': thumbnail_properties
+    }
+
+
 @app.route('/generate-from-prompt', methods=['POST'])
 def generate_from_prompt():
     if 'file' not in request.files:
@@ -192,10 +438,7 @@ def generate_from_prompt():
         return jsonify({'error': 'No prompt provided'}), 400
     
     if file and allowed_file(file.filename):
-        # Generate a unique filename to avoid collisions
-        unique_filename = str(uuid.uuid4()) + os.path.splitext(file.filename)[1]
-        upload_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(upload_path)
+        unique_filename, image_bytes = store_upload(file)
         
         try:
             # Process the prompt
@@ -210,42 +453,359 @@ def generate_from_prompt():
             print(f"Background Removal: {thumbnail_properties.get('remove_background', False)}")
             print(f"===================================\n\n")
             
-            # Load and process the image
-            image = load_image(upload_path)
-            resized_image = resize_image(image.convert('RGB'), Config.IMAGE_SIZE)
+            return jsonify(run_prompt_pipeline(image_bytes, unique_filename, prompt, thumbnail_properties))
             
-            # Generate thumbnail using AI with prompt properties
-            # Note: the background removal and positioning will be handled by the generator
-            thumbnail = generator.generate_thumbnail(resized_image, thumbnail_properties)
+        except OverloadedError:
+            raise
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
+    return jsonify({'error': 'Invalid file type'}), 400
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_generation_job():
+    """Queue a prompt-based generation and return a job id right away"""
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    file = request.files['file']
+    prompt = request.form.get('prompt', '')
+    
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    
+    if not prompt:
+        return jsonify({'error': 'No prompt provided'}), 400
+    
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    
+    # The upload is read into memory before the request stream closes
+    unique_filename, image_bytes = store_upload(file)
+    
+    thumbnail_properties = prompt_engine.analyze_prompt(prompt)
+    
+    try:
+        job = job_queue.submit('generate-from-prompt', run_prompt_pipeline,
+                               image_bytes, unique_filename, prompt, thumbnail_properties)
+    except QueueFullError as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('job_status', job_id=job.id),
+        'result_url': url_for('job_result', job_id=job.id),
+        'timing_url': url_for('job_timing', job_id=job.id),
+        'events_url': url_for('job_events', job_id=job.id)
+    }), 202
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.status == 'failed':
+        return jsonify({'error': job.error}), 500
+    if job.status != 'done':
+        return jsonify(job.to_dict()), 202
+    return jsonify(job.result)
+
+
+@app.route('/jobs/<job_id>/timing')
+def job_timing(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    timing = job.timing()
+    timing['status'] = job.status
+    return jsonify(timing)
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-Sent Events stream of a job's progress, ending with a done or failed event"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    
+    # EventSource resends the last id it saw when it reconnects
+    try:
+        cursor = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        cursor = 0
+    
+    def stream_events():
+        position = cursor
+        yield 'retry: 2000\n\n'
+        while True:
+            events = job.wait_for_events(position, timeout=Config.SSE_KEEPALIVE_SECONDS)
+            if not events:
+                # Comment lines keep proxies and gateways from timing out idle streams
+                yield ': keep-alive\n\n'
+                continue
+            for event, data in events:
+                yield f'id: {position}\nevent: {event}\ndata: {json.dumps(data)}\n\n'
+                position += 1
+                if event in ('done', 'failed'):
+                    return
+    
+    return Response(stream_with_context(stream_events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/generate-batch', methods=['POST'])
+def generate_batch():
+    """Generate thumbnails for many uploads and stream results back as NDJSON"""
+    files = [file for file in request.files.getlist('files') if file.filename]
+    prompts = request.form.getlist('prompts') or request.form.getlist('prompt')
+    
+    if not files:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    if len(files) > Config.MAX_BATCH_IMAGES:
+        return jsonify({'error': f'At most {Config.MAX_BATCH_IMAGES} images per batch'}), 400
+    
+    if not prompts:
+        return jsonify({'error': 'No prompt provided'}), 400
+    
+    if len(prompts) not in (1, len(files)):
+        return jsonify({'error': 'Provide one prompt, or one prompt per file'}), 400
+    
+    if not all(allowed_file(file.filename) for file in files):
+        return jsonify({'error': 'Invalid file type'}), 400
+    
+    if len(prompts) == 1:
+        prompts = prompts * len(files)
+    
+    # Read uploads now, since the request stream is gone once streaming starts
+    uploads = [store_upload(file) for file in files]
+    
+    properties_list = [prompt_engine.analyze_prompt(prompt) for prompt in prompts]
+    
+    def load_resized():
+        # Images are decoded lazily so only one model batch is held in memory;
+        # a corrupt upload is passed on as its error instead of ending the stream
+        for _, image_bytes in uploads:
+            try:
+                image = decode_image(image_bytes)
+                yield resize_image(image.convert('RGB'), Config.IMAGE_SIZE)
+            except Exception as e:
+                yield ValueError(f'Could not decode image: {e}')
+    
+    content_hashes = [upload_hash(unique_filename) for unique_filename, _ in uploads]
+    
+    def stream_results():
+        failed = 0
+        for index, thumbnail, error in generator.iter_batch(load_resized(), properties_list, content_hashes):
+            unique_filename = uploads[index][0]
+            if error is not None:
+                failed += 1
+                yield json.dumps({'index': index, 'error': str(error)}) + '\n'
+                continue
             
-            # Save the generated thumbnail
-            output_filename = f'ai_thumbnail_{unique_filename}'
-            output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
-            save_image(thumbnail, output_path)
+            output_filename, encoding = save_thumbnail(thumbnail, 'ai_thumbnail')
             
-            # Save to database
             thumbnail_id = str(uuid.uuid4())
             thumbnail_db.save_thumbnail(
                 thumbnail_id=thumbnail_id,
                 original_path=f'/uploads/{unique_filename}',
                 thumbnail_path=f'/thumbnails/{output_filename}',
-                prompt=prompt,
-                properties=thumbnail_properties
+                prompt=prompts[index],
+                properties=properties_list[index]
             )
             
-            # Return the paths and thumbnail ID
-            return jsonify({
-                'success': True,
+            yield json.dumps({
+                'index': index,
                 'thumbnail_id': thumbnail_id,
                 'original_image': f'/uploads/{unique_filename}',
                 'thumbnail_image': f'/thumbnails/{output_filename}',
-                'properties': thumbnail_properties
+                'encoding': encoding
+            }) + '\n'
+        
+        yield json.dumps({'done': True, 'count': len(uploads), 'failed': failed}) + '\n'
+    
+    return Response(stream_with_context(stream_results()), mimetype='application/x-ndjson')
+
+
+def variant_properties(base_properties, override):
+    """Apply one variant's overrides (template, positions, text_color, ...) to analyzed prompt properties"""
+    properties = copy.deepcopy(base_properties)
+    for key, value in override.items():
+        if key == 'positions':
+            properties['positions'] = {**properties.get('positions', {}), **value}
+        else:
+            properties[key] = value
+    return properties
+
+
+@app.route('/generate-variants', methods=['POST'])
+def generate_variants():
+    """Generate A/B variants of one upload plus a contact sheet comparing them"""
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    file = request.files['file']
+    prompt = request.form.get('prompt', '')
+    
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    
+    if not prompt:
+        return jsonify({'error': 'No prompt provided'}), 400
+    
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    
+    # Either explicit overrides as a JSON list, or the first `count` presets
+    try:
+        if request.form.get('variants'):
+            overrides = json.loads(request.form['variants'])
+            if not isinstance(overrides, list) or not all(isinstance(item, dict) for item in overrides):
+                raise ValueError('variants must be a JSON list of objects')
+        else:
+            count = request.form.get('count', '4')
+            max_count = min(Config.MAX_VARIANTS, len(Config.VARIANT_PRESETS))
+            if not count.isdigit() or not 1 <= int(count) <= max_count:
+                raise ValueError(f'count must be an integer between 1 and {max_count}')
+            overrides = Config.VARIANT_PRESETS[:int(count)]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not 1 <= len(overrides) <= Config.MAX_VARIANTS:
+        return jsonify({'error': f'Request between 1 and {Config.MAX_VARIANTS} variants'}), 400
+    
+    unique_filename, image_bytes = store_upload(file)
+    thumbnail_properties = prompt_engine.analyze_prompt(prompt)
+    properties_list = [variant_properties(thumbnail_properties, override) for override in overrides]
+    
+    try:
+        with timed('decode'):
+            image = decode_image(image_bytes)
+        with timed('resize'):
+            resized_image = resize_image(image.convert('RGB'), Config.IMAGE_SIZE)
+        
+        thumbnails = generator.generate_variants(resized_image, properties_list,
+                                                 content_hash=upload_hash(unique_filename))
+        
+        variants = []
+        for override, properties, thumbnail in zip(overrides, properties_list, thumbnails):
+            output_filename, encoding = save_thumbnail(thumbnail, 'ai_thumbnail')
+            thumbnail_id = str(uuid.uuid4())
+            thumbnail_db.save_thumbnail(
+                thumbnail_id=thumbnail_id,
+                original_path=f'/uploads/{unique_filename}',
+                thumbnail_path=f'/thumbnails/{output_filename}',
+                prompt=prompt,
+                properties=properties
+            )
+            variants.append({
+                'thumbnail_id': thumbnail_id,
+                'thumbnail_image': f'/thumbnails/{output_filename}',
+                'overrides': override,
+                'encoding': encoding
             })
-            
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+        
+        with timed('contact_sheet'):
+            sheet = contact_sheet(thumbnails, Config.CONTACT_SHEET_TILE_SIZE, Config.CONTACT_SHEET_COLUMNS)
+        sheet_filename, _ = save_thumbnail(sheet, 'contact_sheet', with_variants=False)
+    except OverloadedError:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
     
-    return jsonify({'error': 'Invalid file type'}), 400
+    return jsonify({
+        'success': True,
+        'original_image': f'/uploads/{unique_filename}',
+        'contact_sheet': f'/thumbnails/{sheet_filename}',
+        'variants': variants,
+        'properties': thumbnail_properties
+    })
+
+
+@app.route('/preview', methods=['POST'])
+def render_preview():
+    """Render a low-resolution preview for iterating on a prompt
+
+    The response carries everything /finalize needs to render the same
+    thumbnail at full resolution.
+    """
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    file = request.files['file']
+    prompt = request.form.get('prompt', '')
+    
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    
+    if not prompt:
+        return jsonify({'error': 'No prompt provided'}), 400
+    
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    
+    unique_filename, image_bytes = store_upload(file)
+    
+    try:
+        thumbnail_properties = prompt_engine.analyze_prompt(prompt)
+        with timed('decode'):
+            image = decode_image(image_bytes)
+        preview, properties = generator.render_preview(image, thumbnail_properties)
+    except OverloadedError:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'success': True,
+        'upload': unique_filename,
+        'original_image': f'/uploads/{unique_filename}',
+        'preview': preview_data_uri(preview, Config.PREVIEW_RENDER_SIZE),
+        'prompt': prompt,
+        'properties': properties,
+        'finalize_url': url_for('finalize_preview')
+    })
+
+
+@app.route('/finalize', methods=['POST'])
+def finalize_preview():
+    """Render a preview from /preview at full resolution and save it
+
+    Expects the JSON fields upload, prompt and properties from the preview response.
+    """
+    data = request.get_json(silent=True) or {}
+    unique_filename = data.get('upload')
+    properties = data.get('properties')
+    
+    if not unique_filename or not isinstance(properties, dict):
+        return jsonify({'error': 'upload and properties are required'}), 400
+    
+    if safe_join(upload_store.folder, unique_filename) is None:
+        abort(404)
+    image_bytes = upload_store.read(unique_filename)
+    if image_bytes is None:
+        return jsonify({'error': 'Upload not found, please upload the image again'}), 404
+    
+    try:
+        return jsonify(run_prompt_pipeline(image_bytes, unique_filename, data.get('prompt', ''), properties,
+                                           finalize=True))
+    except OverloadedError:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 
 @app.route('/analyze', methods=['POST'])
@@ -262,21 +822,14 @@ def analyze_image():
         return jsonify({'error': 'No selected file'}), 400
     
     if file and allowed_file(file.filename):
-        # Save the file temporarily
-        unique_filename = str(uuid.uuid4()) + os.path.splitext(file.filename)[1]
-        upload_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(upload_path)
+        unique_filename, image_bytes = store_upload(file)
         
         try:
             # Process the image
-            image = load_image(upload_path)
+            image = decode_image(image_bytes)
             
-            # Create content analyzer
-            from src.ai.content_analyzer import ContentAnalyzer
-            analyzer = ContentAnalyzer()
-            
-            # Analyze image
-            content_info = analyzer.analyze(image)
+            # Analyze image with the generator's analyzer, whose models are already loaded
+            content_info = generator.content_analyzer.analyze(image, upload_hash(unique_filename))
             
             # Convert numpy arrays to lists for JSON serialization
             faces = content_info['faces'].tolist() if isinstance(content_info['faces'], np.ndarray) else []
@@ -302,20 +855,103 @@ def analyze_image():
                 'preview_image': f'data:image/jpeg;base64,{img_str}'
             })
             
+        except OverloadedError:
+            raise
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
     return jsonify({'error': 'Invalid file type'}), 400
 
 
+def conditional_file_response(data, filename, etag=None):
+    """Build a cacheable response with a strong ETag that honours If-None-Match"""
+    response = Response(data, mimetype=mimetypes.guess_type(filename)[0])
+    response.set_etag(etag or content_etag(data))
+    response.cache_control.public = True
+    response.cache_control.max_age = Config.THUMBNAIL_CACHE_MAX_AGE
+    return response.make_conditional(request)
+
+
+def send_stored_file(store, filename):
+    """Serve a stored file, including ones still queued in the write-behind writer"""
+    if safe_join(store.folder, filename) is None:
+        abort(404)
+    
+    pending = store.pending(filename)
+    if pending is not None:
+        return conditional_file_response(pending, filename)
+    
+    path = store.locate(filename)
+    if path is None:
+        # Another worker process may still be writing it
+        published = store.published(filename)
+        if published is None:
+            abort(404)
+        return conditional_file_response(published, filename)
+    
+    # Answer revalidations from the ETag index without touching the file content
+    stat = os.stat(path)
+    etag = etag_index.lookup(path, stat)
+    if etag is not None and request.if_none_match.contains(etag):
+        return conditional_file_response(b'', filename, etag)
+    
+    with open(path, 'rb') as f:
+        data = f.read()
+    etag = content_etag(data)
+    etag_index.remember(path, stat, etag)
+    return conditional_file_response(data, filename, etag)
+
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_stored_file(upload_store, filename)
 
 
 @app.route('/thumbnails/<filename>')
 def thumbnail_file(filename):
-    return send_from_directory(app.config['OUTPUT_FOLDER'], filename)
+    size = request.args.get('size')
+    if not size:
+        return send_stored_file(thumbnail_store, filename)
+    
+    variant = thumbnail_variants.resolve(size)
+    if variant is None:
+        return jsonify({'error': f'Unknown thumbnail size: {size}'}), 400
+    
+    data = thumbnail_variants.read(filename, variant)
+    if data is None:
+        abort(404)
+    return conditional_file_response(data, filename)
+
+
+@app.route('/cache-stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+
+@app.route('/models')
+def loaded_models():
+    """Models loaded in this process, with their load time and weight memory"""
+    return jsonify(model_registry.stats())
+
+
+@app.route('/storage-stats')
+def storage_stats():
+    """Results of the last storage compaction pass in this process"""
+    return jsonify(storage_compactor.last_run or {})
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for this process"""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once models are loaded and warmed up in this process"""
+    if not readiness.is_set():
+        return jsonify({'ready': False, 'pid': os.getpid()}), 503
+    return jsonify({'ready': True, 'pid': os.getpid()})
 
 
 @app.route('/ai-prompt')
@@ -493,4 +1129,5 @@ download_google_fonts()
 
 
 if __name__ == '__main__':
+    warm_up()
     app.run(debug=True)
\ No newline at end of file
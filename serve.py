@@ -0,0 +1,144 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from src.config.settings import Config
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the thumbnail generator in several worker processes on one socket')
+    parser.add_argument('--host', default=Config.SERVER_HOST,
+                        help=f'Interface to bind (default: {Config.SERVER_HOST})')
+    parser.add_argument('--port', type=int, default=Config.SERVER_PORT,
+                        help=f'Port to bind (default: {Config.SERVER_PORT})')
+    parser.add_argument('--workers', '-w', type=int, default=Config.SERVER_WORKERS,
+                        help=f'Number of worker processes (default: {Config.SERVER_WORKERS})')
+    parser.add_argument('--backlog', type=int, default=128,
+                        help='Listen backlog shared by all workers (default: 128)')
+    return parser.parse_args()
+
+
+def limit_tensorflow_threads(workers):
+    """Split the CPU between workers so their TensorFlow thread pools do not oversubscribe it"""
+    # TensorFlow reads these once when its runtime starts, so they must be set before import
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    os.environ.setdefault('TF_NUM_INTRAOP_THREADS', str(threads))
+    os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+
+
+def run_worker(listener, host, port):
+    """Worker process body: warm up, then serve requests from the shared socket"""
+    from werkzeug.serving import make_server
+    import app as thumbnail_app
+
+    def exit_now(signum, frame):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        sys.exit(0)
+
+    # Ctrl+C reaches the whole process group; the master decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, exit_now)
+
+    try:
+        thumbnail_app.warm_up()
+    except Exception as e:
+        print(f"Worker {os.getpid()} failed to warm up: {e}")
+        return 1
+
+    server = make_server(host, port, thumbnail_app.app, threaded=True, fd=listener.fileno())
+
+    def shut_down(signum, frame):
+        # Finish in-flight requests; shutdown() blocks, so it cannot run on the serving thread
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, shut_down)
+    print(f"Worker {os.getpid()} ready")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+    return 0
+
+
+def spawn_worker(listener, host, port):
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            code = run_worker(listener, host, port)
+        finally:
+            # Flush write-behind queues and other atexit handlers before leaving
+            sys.exit(code)
+    return pid
+
+
+def main():
+    args = parse_args()
+    limit_tensorflow_threads(args.workers)
+
+    listener = socket.socket(socket.AF_INET6 if ':' in args.host else socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(args.backlog)
+    listener.set_inheritable(True)
+
+    # TensorFlow's runtime does not survive fork(), so each worker loads its own models in warm_up()
+    Config.PRELOAD_MODELS = False
+
+    # Import the app once so workers start without re-importing it. This does not share
+    # models: every worker holds its own copy, so memory grows with --workers
+    print("Loading app...")
+    start = time.perf_counter()
+    import app as thumbnail_app
+    print(f"App loaded in {time.perf_counter() - start:.2f}s")
+
+    # Keep the imported objects out of the workers' garbage collections
+    gc.collect()
+    gc.freeze()
+
+    workers = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(args.workers):
+        workers.add(spawn_worker(listener, args.host, args.port))
+    print(f"Serving on {args.host}:{args.port} with {args.workers} workers")
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if stopping:
+            continue
+
+        print(f"Worker {pid} exited with status {status}, restarting")
+        time.sleep(1)  # Avoid a tight respawn loop if workers fail on start-up
+        workers.add(spawn_worker(listener, args.host, args.port))
+
+    listener.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
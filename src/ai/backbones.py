@@ -0,0 +1,86 @@
+import threading
+import numpy as np
+from src.ai.model_registry import registry as model_registry
+
+
+class Backbone:
+    """A feature extraction network that is only built on first use
+
+    build() returns a Keras model mapping a (N, size, size, 3) batch of
+    preprocessed images to (N, dim) pooled features; preprocess maps raw
+    0-255 RGB batches to the network's input range.
+    """
+
+    def __init__(self, name, build, preprocess=None, input_size=224, dim=None):
+        self.name = name
+        self.build = build
+        self.preprocess = preprocess
+        self.input_size = input_size
+        self.dim = dim
+
+    @property
+    def model_name(self):
+        """The backbone's name in the model registry"""
+        return f'{self.name}_backbone'
+
+    @property
+    def loaded(self):
+        return model_registry.loaded(self.model_name)
+
+    @property
+    def model(self):
+        return model_registry.get(self.model_name, self._build)
+
+    def _build(self):
+        print(f"Loading {self.name} feature backbone")
+        return self.build()
+
+    def __call__(self, batch):
+        """Pooled features, shape (N, dim), for a (N, input_size, input_size, 3) RGB batch"""
+        batch = np.asarray(batch, dtype=np.float32)
+        if self.preprocess is not None:
+            batch = self.preprocess(batch)
+        return np.asarray(self.model(batch, training=False))
+
+
+def _mobilenet():
+    import tensorflow as tf
+    # Rescaling to MobileNetV3's input range is part of the model itself
+    return tf.keras.applications.MobileNetV3Small(weights='imagenet', include_top=False, pooling='avg',
+                                                  input_shape=(224, 224, 3))
+
+
+def _resnet50():
+    import tensorflow as tf
+    return tf.keras.applications.ResNet50(weights='imagenet', include_top=False, pooling='avg')
+
+
+def _resnet50_preprocess(batch):
+    from tensorflow.keras.applications.resnet50 import preprocess_input
+    return preprocess_input(batch)
+
+
+# Factories for the available backbones; 'none' disables feature extraction
+BACKBONES = {
+    'mobilenet': lambda: Backbone('mobilenet', _mobilenet, dim=576),
+    'resnet50': lambda: Backbone('resnet50', _resnet50, _resnet50_preprocess, dim=2048),
+    'none': lambda: None
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def register_backbone(name, factory):
+    """Add a backbone; factory() returns a Backbone (or None to disable features)"""
+    BACKBONES[name] = factory
+
+
+def get_backbone(name):
+    """Return the shared Backbone for a name, or None for 'none'; the network itself loads on first use"""
+    if name not in BACKBONES:
+        raise ValueError(f"Unknown feature backbone '{name}', expected one of: {', '.join(BACKBONES)}")
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = BACKBONES[name]()
+        return _instances[name]
@@ -1,59 +1,134 @@
+import threading
 import cv2
 import numpy as np
 from PIL import Image, ImageOps
-import tensorflow as tf
-from tensorflow.keras.applications.resnet50 import ResNet50, preprocess_input
-from tensorflow.keras.preprocessing import image as keras_image
+from src.config.settings import Config
+from src.ai.backbones import get_backbone
+from src.ai.model_registry import registry as model_registry
+from src.utils.metrics import timed, record_inference
+from src.utils.admission import admit
+from src.utils.micro_batcher import MicroBatcher
+from src.utils.embedding_store import pool_features
+
+
+def guided_upsample(mask, guide_small, guide, radius=4, eps=1e-3):
+    """Upsample a low-resolution 0/1 mask to the guide's size, snapping its edges to the guide's edges
+    
+    This is the fast guided filter: the local linear model between guide and
+    mask is fitted at low resolution (guide_small has the mask's size), and
+    only its coefficients are upsampled and applied to the full-resolution
+    guide. Returns a float alpha matte in [0, 1].
+    """
+    size = (2 * radius + 1, 2 * radius + 1)
+    mean = lambda values: cv2.boxFilter(values, -1, size)
+    
+    small = guide_small.astype(np.float32) / 255.0
+    mask = mask.astype(np.float32)
+    mean_guide, mean_mask = mean(small), mean(mask)
+    covariance = mean(small * mask) - mean_guide * mean_mask
+    variance = mean(small * small) - mean_guide * mean_guide
+    a = covariance / (variance + eps)
+    b = mean_mask - a * mean_guide
+    
+    height, width = guide.shape[:2]
+    a = cv2.resize(mean(a), (width, height), interpolation=cv2.INTER_LINEAR)
+    b = cv2.resize(mean(b), (width, height), interpolation=cv2.INTER_LINEAR)
+    return np.clip(a * (guide.astype(np.float32) / 255.0) + b, 0.0, 1.0)
+
+
+def load_face_cascade():
+    return cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
 
 class ContentAnalyzer:
-    def __init__(self):
-        self.model = ResNet50(weights='imagenet', include_top=False)
-        # Load face detection model
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    def __init__(self, embedding_store=None, backbone=None):
+        # The feature network (Config.FEATURE_BACKBONE by default) is shared and loads on first use
+        self.backbone = backbone if backbone is not None else get_backbone(Config.FEATURE_BACKBONE)
+        # Pooled features are kept here, so each image only goes through the backbone once
+        self.embedding_store = embedding_store
+        # Load face detection model (once per process)
+        self.face_cascade = model_registry.get('face_cascade', load_face_cascade)
+        # Feature extractions from concurrent requests share backbone forward passes
+        max_concurrent, max_waiting = Config.STAGE_LIMITS['analysis']
+        self._feature_batcher = MicroBatcher(self._extract_features_batch, Config.MICRO_BATCH_MAX_SIZE,
+                                             Config.MICRO_BATCH_MAX_DELAY, name='feature-batcher',
+                                             workers=max_concurrent,
+                                             max_pending=max_waiting * Config.MICRO_BATCH_MAX_SIZE,
+                                             timeout=Config.STAGE_WAIT_TIMEOUT, stage='analysis')
         
-    def analyze(self, image):
-        """Analyze image content and return content info"""
-        # Convert PIL image to numpy array for OpenCV
-        img_array = np.array(image)
-        img_cv = img_array[:, :, ::-1].copy()  # Convert RGB to BGR for OpenCV
-        
-        # Analyze image for face detection
-        faces = self.detect_faces(img_cv)
-        
-        # Get image features using ResNet
-        features = self.extract_features(image)
-        
-        # Analyze image brightness/contrast
-        brightness, contrast = self.analyze_lighting(img_array)
-        
-        # Find optimal text placement areas (areas with less detail)
-        text_regions = self.find_text_regions(img_array)
+    def close(self):
+        """Stop the background threads that batch feature extractions"""
+        self._feature_batcher.close()
+    
+    def context(self, image, content_hash=None):
+        """Return a lazily evaluated AnalysisContext for an image"""
+        return AnalysisContext(self, image, content_hash)
+    
+    def analyze(self, image, content_hash=None):
+        """Analyze image content and return content info
         
+        content_hash identifies the upload the image was decoded from; with it
+        the embedding comes from the embedding store when the upload was seen
+        before (None when feature extraction is disabled).
+        """
+        context = self.context(image, content_hash)
+        brightness, contrast = context.lighting
         return {
-            'faces': faces,
-            'features': features,
+            'faces': context.faces,
             'brightness': brightness,
             'contrast': contrast,
-            'text_regions': text_regions
+            'text_regions': context.text_regions,
+            'embedding': context.embedding
         }
     
-    def detect_faces(self, img_cv):
-        """Detect faces in the image"""
-        gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
+    def detect_faces(self, img):
+        """Detect faces in a BGR or grayscale image"""
+        with timed('face_detection'):
+            if len(img.shape) == 3:
+                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            else:
+                gray = img
+            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
         return faces
     
     def extract_features(self, img):
-        """Extract image features using ResNet"""
-        # Resize for ResNet
-        img_resized = img.resize((224, 224))
-        x = keras_image.img_to_array(img_resized)
-        x = np.expand_dims(x, axis=0)
-        x = preprocess_input(x)
+        """Extract pooled image features, shape (1, dim), with the feature backbone"""
+        if self.backbone is None:
+            raise RuntimeError("Feature extraction is disabled (FEATURE_BACKBONE is 'none')")
+        
+        # Resize for the backbone
+        size = self.backbone.input_size
+        x = np.asarray(img.convert('RGB').resize((size, size)), dtype=np.float32)
         
-        # Get features
-        features = self.model.predict(x)
-        return features
+        # Get features (batched with other requests' images)
+        with timed('feature_extraction'):
+            return self._feature_batcher.submit(x)
+    
+    def embedding(self, image, features=None, content_hash=None):
+        """Pooled feature vector of an image, from the embedding store when it has one
+        
+        features, if given, is the image's already extracted features. The
+        embedding is only stored under content_hash, the hash of the original
+        upload, so derived images (previews, resized copies) never get their
+        own entries. Returns None when feature extraction is disabled.
+        """
+        if self.backbone is None:
+            return None
+        
+        def compute():
+            return pool_features(features if features is not None else self.extract_features(image))
+        
+        if self.embedding_store is None or content_hash is None:
+            return compute()
+        return self.embedding_store.get_or_compute(content_hash, compute)
+    
+    def _extract_features_batch(self, arrays):
+        """Run the backbone over stacked image arrays; returns one (1, dim) feature array per image"""
+        # Admission is per backbone call, so one slot covers a whole micro-batch
+        with admit('analysis'):
+            features = self.backbone(np.stack(arrays))
+        record_inference(self.backbone.name, len(arrays))
+        return [features[i:i + 1] for i in range(len(arrays))]
     
     def analyze_lighting(self, img_array):
         """Analyze image brightness and contrast"""
@@ -71,20 +146,24 @@ class ContentAnalyzer:
         
         return brightness, contrast
     
-    def find_text_regions(self, img_array):
-        """Find regions suitable for text placement"""
+    def find_text_regions(self, img_array, kernel_size=20):
+        """Find regions suitable for text placement
+        
+        kernel_size is the edge-density window; 20 suits a 1280x720 frame.
+        """
         # Convert to grayscale
         if len(img_array.shape) == 3:
             img_gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
         else:
             img_gray = img_array
             
-        # Apply edge detection
-        edges = cv2.Canny(img_gray, 100, 200)
-        
-        # Find regions with low edge density (good for text)
-        kernel = np.ones((20, 20), np.uint8)
-        edge_density = cv2.filter2D(edges, -1, kernel)
+        with timed('text_region_detection'):
+            # Apply edge detection
+            edges = cv2.Canny(img_gray, 100, 200)
+            
+            # Find regions with low edge density (good for text)
+            kernel = np.ones((kernel_size, kernel_size), np.uint8)
+            edge_density = cv2.filter2D(edges, -1, kernel)
         
         # Get top regions with lowest edge density
         h, w = edge_density.shape
@@ -107,8 +186,11 @@ class ContentAnalyzer:
         
         return [r[0] for r in regions]
     
-    def remove_background(self, image, target_area=None):
-        """Remove background from a person in the image"""
+    def remove_background(self, image, target_area=None, faces=None):
+        """Remove background from a person in the image
+        
+        faces, if given, are the already detected faces of the image.
+        """
         # Convert PIL image to numpy array for OpenCV
         img_array = np.array(image)
         img_cv = img_array[:, :, ::-1].copy()  # Convert RGB to BGR for OpenCV
@@ -118,16 +200,39 @@ class ContentAnalyzer:
             x, y, w, h = target_area
             img_cv = img_cv[y:y+h, x:x+w]
         
-        # Create a mask using GrabCut algorithm
-        mask = np.zeros(img_cv.shape[:2], np.uint8)
-        
         # Set up the rectangle for GrabCut
-        rect = None
-        if target_area:
-            rect = (0, 0, img_cv.shape[1], img_cv.shape[0])
-        else:
+        rect = (0, 0, img_cv.shape[1], img_cv.shape[0]) if target_area else None
+        mask = self.foreground_mask(img_cv, faces, rect)
+        if mask is None:
+            return image.convert("RGBA")
+        
+        # Apply the mask to the image
+        result = img_cv * mask[:, :, np.newaxis]
+        
+        # Convert back to RGB for PIL
+        result_rgb = result[:, :, ::-1]
+        
+        # Create PIL image with alpha channel
+        result_img = Image.fromarray(result_rgb).convert("RGBA")
+        
+        # Create alpha mask from the grayscale mask
+        alpha_mask = Image.fromarray((mask * 255).astype(np.uint8))
+        
+        # Apply alpha mask to image
+        result_img.putalpha(alpha_mask)
+        
+        return result_img
+    
+    def foreground_mask(self, img_cv, faces=None, rect=None):
+        """GrabCut a BGR image into a 0/1 foreground mask, or None if it fails
+        
+        Without rect, the cut starts from a body-sized box around the largest
+        face (detected if faces is None), or the image center.
+        """
+        if rect is None:
             # If no target area, use face detection to help
-            faces = self.detect_faces(img_cv)
+            if faces is None:
+                faces = self.detect_faces(img_cv)
             if len(faces) > 0:
                 # Use the largest face as a guide
                 largest_face = max(faces, key=lambda f: f[2] * f[3])
@@ -147,37 +252,138 @@ class ContentAnalyzer:
                 rect = (img_cv.shape[1]//4, img_cv.shape[0]//4, 
                         img_cv.shape[1]//2, img_cv.shape[0]//2)
         
+        # Create a mask using GrabCut algorithm
+        mask = np.zeros(img_cv.shape[:2], np.uint8)
+        
         # Initialize background and foreground models
         bgd_model = np.zeros((1, 65), np.float64)
         fgd_model = np.zeros((1, 65), np.float64)
         
-        # Apply GrabCut
-        if rect:
-            try:
+        try:
+            with timed('grabcut'):
                 cv2.grabCut(img_cv, mask, rect, bgd_model, fgd_model, 5, cv2.GC_INIT_WITH_RECT)
+        except Exception as e:
+            print(f"Background removal failed: {e}")
+            return None
+        
+        # Create mask where sure and probable foreground are set to 1
+        return np.where((mask == 2) | (mask == 0), 0, 1).astype('uint8')
+
+
+class AnalysisContext:
+    """Analysis of one image, computed on first access and then reused
+    
+    Every stage of a generation shares one context, so each analysis runs at
+    most once per image and only if some stage reads it. Contexts may be
+    shared across threads (e.g. by variants composed in parallel); concurrent
+    readers of a field wait for the first one to compute it.
+    
+    Detection and segmentation run on a proxy downscaled so its longer side
+    is at most Config.ANALYSIS_PROXY_MAX_SIDE; faces are mapped back to image
+    coordinates and the foreground mask is upsampled with a guided filter.
+    """
+    
+    def __init__(self, analyzer, image, content_hash=None):
+        self.analyzer = analyzer
+        self.image = image
+        self.content_hash = content_hash
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+    
+    def _memoize(self, name, compute):
+        if name in self._values:
+            return self._values[name]
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._values:
+                self._values[name] = compute()
+        return self._values[name]
+    
+    @property
+    def scale(self):
+        """Proxy size divided by image size (1.0 when the image is already small enough)"""
+        return min(1.0, Config.ANALYSIS_PROXY_MAX_SIDE / max(self.image.size))
+    
+    @property
+    def rgb(self):
+        """The proxy as an RGB array"""
+        def compute():
+            image = self.image.convert('RGB')
+            if self.scale < 1.0:
+                width, height = image.size
+                size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+                with timed('analysis_proxy'):
+                    image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+            return np.array(image)
+        return self._memoize('rgb', compute)
+    
+    @property
+    def gray(self):
+        """The proxy in grayscale"""
+        return self._memoize('gray', lambda: cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY))
+    
+    @property
+    def proxy_faces(self):
+        def compute():
+            with admit('analysis'):
+                return self.analyzer.detect_faces(self.gray)
+        return self._memoize('proxy_faces', compute)
+    
+    @property
+    def faces(self):
+        """Face boxes (x, y, w, h) in image coordinates"""
+        def compute():
+            faces = self.proxy_faces
+            if len(faces) == 0 or self.scale == 1.0:
+                return faces
+            return np.round(np.asarray(faces) / self.scale).astype(int)
+        return self._memoize('faces', compute)
+    
+    @property
+    def features(self):
+        return self._memoize('features', lambda: self.analyzer.extract_features(self.image))
+    
+    @property
+    def embedding(self):
+        """Pooled feature vector of the image; stored, so the backbone runs once per image content"""
+        def compute():
+            return self.analyzer.embedding(self.image, self._values.get('features'), self.content_hash)
+        return self._memoize('embedding', compute)
+    
+    @property
+    def lighting(self):
+        """(brightness, contrast) of the image"""
+        return self._memoize('lighting', lambda: self.analyzer.analyze_lighting(self.gray))
+    
+    @property
+    def foreground(self):
+        """The image with its background cut away around the detected faces (RGBA)"""
+        def compute():
+            faces = self.proxy_faces
+            with admit('background_removal'), timed('background_removal'):
+                if self.scale == 1.0:
+                    return self.analyzer.remove_background(self.image, faces=faces)
                 
-                # Create mask where sure and probable foreground are set to 1
-                mask2 = np.where((mask == 2) | (mask == 0), 0, 1).astype('uint8')
-                
-                # Apply the mask to the image
-                result = img_cv * mask2[:, :, np.newaxis]
-                
-                # Convert back to RGB for PIL
-                result_rgb = result[:, :, ::-1]
-                
-                # Create PIL image with alpha channel
-                result_img = Image.fromarray(result_rgb).convert("RGBA")
-                
-                # Create alpha mask from the grayscale mask
-                alpha_mask = Image.fromarray((mask2 * 255).astype(np.uint8))
-                
-                # Apply alpha mask to image
-                result_img.putalpha(alpha_mask)
-                
-                return result_img
+                mask = self.analyzer.foreground_mask(self.rgb[:, :, ::-1].copy(), faces)
+                if mask is None:
+                    return self.image.convert('RGBA')
                 
-            except Exception as e:
-                print(f"Background removal failed: {e}")
-                return image.convert("RGBA")
-        
-        return image.convert("RGBA")
\ No newline at end of file
+                # Snap the upsampled mask to the full-resolution edges
+                with timed('mask_upsample'):
+                    guide = np.array(self.image.convert('L'))
+                    alpha = guided_upsample(mask, self.gray, guide, Config.ANALYSIS_MASK_RADIUS)
+                result = self.image.convert('RGBA')
+                result.putalpha(Image.fromarray((alpha * 255.0 + 0.5).astype(np.uint8)))
+                return result
+        return self._memoize('foreground', compute)
+    
+    @property
+    def text_regions(self):
+        def compute():
+            # Keep the edge-density window the same fraction of the frame as at 1280 wide
+            kernel_size = max(3, round(20 * self.gray.shape[1] / Config.IMAGE_SIZE[0]))
+            with admit('analysis'):
+                return self.analyzer.find_text_regions(self.gray, kernel_size)
+        return self._memoize('text_regions', compute)
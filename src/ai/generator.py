@@ -2,59 +2,262 @@ from PIL import Image, ImageDraw, ImageFont, ImageEnhance, ImageOps, ImageFilter
 import numpy as np
 import os
 import json
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.config.settings import Config
 from src.ai.content_analyzer import ContentAnalyzer
+from src.ai.render_plan import RenderPlanCache, element_arrow, parse_color
+from src.ai.template_registry import TemplateRegistry
+from src.image_processing.compositing import composite, solid, vertical_gradient
+from src.image_processing.text_renderer import TextRenderer
+from src.image_processing.sprites import SpriteAtlas
+from src.utils.metrics import timed
+from src.utils.admission import OverloadedError
+
+# Modern eye-catching YouTube fonts, tried in order
+YOUTUBE_FONTS = [
+    'Montserrat-Bold.ttf',
+    'Roboto-Black.ttf',
+    'OpenSans-ExtraBold.ttf',
+    'Poppins-Bold.ttf',
+    os.path.join(Config.FONTS_PATH, 'Montserrat-Bold.ttf'),
+    os.path.join(Config.FONTS_PATH, 'Roboto-Black.ttf'),
+    'C:\\Windows\\Fonts\\Arial.ttf'
+]
 
 class ThumbnailGenerator:
-    def __init__(self, model):
+    def __init__(self, model, embedding_store=None):
         self.model = model
-        self.content_analyzer = ContentAnalyzer()
-        self.templates = self._load_templates()
+        self.content_analyzer = ContentAnalyzer(embedding_store)
+        self.templates = TemplateRegistry(Config.TEMPLATES_PATH, Config.TEMPLATE_RELOAD_INTERVAL,
+                                          Config.DEFAULT_TEMPLATE)
+        self.render_plans = RenderPlanCache()
+        self.text_renderer = TextRenderer(YOUTUBE_FONTS)
+        self.sprites = SpriteAtlas(rotation_step=Config.SPRITE_ROTATION_STEP)
+        self._batch_executor = ThreadPoolExecutor(max_workers=Config.ANALYSIS_WORKERS,
+                                                  thread_name_prefix='thumbnail-analysis')
+        
+    def generate_thumbnail(self, image, prompt_properties=None, progress=None, content_hash=None):
+        """Generate a thumbnail based on image and prompt properties
+        
+        progress, if given, is called as progress(stage, image=None) after each
+        stage finishes, with an intermediate image where one is available.
+        content_hash, the hash of the upload the image came from, is the key
+        its embedding is stored under.
+        """
+        # Make a copy of the original image
+        img = image.copy()
+        self._store_embedding(img, content_hash)
         
-    def _load_templates(self):
-        """Load all template definitions"""
-        templates = {}
-        template_files = os.listdir(Config.TEMPLATES_PATH)
+        # First apply AI enhancements using the model
+        with timed('enhance'):
+            enhanced_image = self.model.predict(img)
         
-        for template_file in template_files:
-            if template_file.endswith('.json'):
-                with open(os.path.join(Config.TEMPLATES_PATH, template_file), 'r') as f:
-                    template_data = json.load(f)
-                    templates[template_data['name']] = template_data
+        if progress:
+            progress('enhanced', enhanced_image)
         
-        return templates
+        return self._compose_thumbnail(enhanced_image, prompt_properties, progress)
     
-    def generate_thumbnail(self, image, prompt_properties=None):
-        """Generate a thumbnail based on image and prompt properties"""
-        # Make a copy of the original image
-        img = image.copy()
+    def render_preview(self, image, prompt_properties=None, size=None, progress=None):
+        """Run the whole pipeline on a downscaled copy of an image for quick iteration
+        
+        Returns (thumbnail, properties). The properties pin the template that
+        was chosen, so finalize(image, properties) renders the same design at
+        full resolution.
+        """
+        properties = dict(prompt_properties or {})
+        properties['template'] = self.select_template(prompt_properties)['name']
+        
+        with timed('resize'):
+            preview_image = image.convert('RGB').resize(size or Config.PREVIEW_RENDER_SIZE, Image.LANCZOS)
+        return self.generate_thumbnail(preview_image, properties, progress), properties
+    
+    def finalize(self, image, properties, progress=None, content_hash=None):
+        """Re-render a preview at full resolution from the properties render_preview returned"""
+        if image.size != tuple(Config.IMAGE_SIZE) or image.mode != 'RGB':
+            with timed('resize'):
+                image = image.convert('RGB').resize(Config.IMAGE_SIZE, Image.LANCZOS)
+        return self.generate_thumbnail(image, properties, progress, content_hash)
+    
+    def generate_batch(self, images, prompt_properties=None, content_hashes=None):
+        """Generate thumbnails for many images, returned in input order"""
+        thumbnails = []
+        for index, thumbnail, error in self.iter_batch(images, prompt_properties, content_hashes):
+            if error is not None:
+                raise error
+            thumbnails.append((index, thumbnail))
+        
+        thumbnails.sort(key=lambda item: item[0])
+        return [thumbnail for _, thumbnail in thumbnails]
+    
+    def iter_batch(self, images, prompt_properties=None, content_hashes=None):
+        """Yield (index, thumbnail, error) tuples as each thumbnail of a batch finishes
+        
+        Images are enhanced in model batches of Config.BATCH_SIZE and the
+        analysis/composition of each batch runs on a thread pool. prompt_properties
+        may be a single dict shared by every image or a list with one entry per image.
+        An exception in place of an image (e.g. a failed decode) is yielded as
+        that index's error. content_hashes, if given, has the upload hash of
+        each image for storing its embedding.
+        """
+        images = iter(images)
+        if isinstance(prompt_properties, (list, tuple)):
+            properties_list = list(prompt_properties)
+        else:
+            properties_list = None
+        
+        start = 0
+        while True:
+            chunk = list(islice(images, Config.BATCH_SIZE))
+            if not chunk:
+                break
+            offsets = []
+            for offset, image in enumerate(chunk):
+                if isinstance(image, Exception):
+                    yield start + offset, None, image
+                else:
+                    offsets.append(offset)
+                    if content_hashes is not None:
+                        self._store_embedding(image, content_hashes[start + offset])
+            if not offsets:
+                start += len(chunk)
+                continue
+            
+            try:
+                with timed('enhance_batch'):
+                    enhanced_images = self.model.predict_batch([chunk[offset].copy() for offset in offsets])
+            except OverloadedError as e:
+                # Report the chunk as failed and keep going with the rest of the batch
+                for offset in offsets:
+                    yield start + offset, None, e
+                start += len(chunk)
+                continue
+            
+            futures = {}
+            for offset, enhanced_image in zip(offsets, enhanced_images):
+                index = start + offset
+                properties = properties_list[index] if properties_list is not None else prompt_properties
+                future = self._batch_executor.submit(self._compose_thumbnail, enhanced_image, properties)
+                futures[future] = index
+            
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+            
+            start += len(chunk)
+    
+    def generate_variants(self, image, variant_properties, progress=None, content_hash=None):
+        """Generate several differently composed thumbnails of one image
+        
+        The image is enhanced and analyzed (faces, foreground mask) once; only
+        the template composition runs per variant, in parallel. Returns the
+        thumbnails in the order of variant_properties.
+        """
+        self._store_embedding(image, content_hash)
+        with timed('enhance'):
+            enhanced_image = self.model.predict(image.copy())
+        
+        if progress:
+            progress('enhanced', enhanced_image)
+        
+        context = self.content_analyzer.context(enhanced_image)
+        # Run the expensive analysis up front rather than in whichever variant gets there first
+        self._analyze(context, variant_properties)
+        
+        if progress:
+            progress('analyzed')
+        
+        def compose(properties):
+            template = self.select_template(properties)
+            with timed('template'):
+                return self._apply_template(enhanced_image, template, properties, context=context)
+        
+        futures = [self._batch_executor.submit(compose, properties) for properties in variant_properties]
+        return [future.result() for future in futures]
+    
+    def _store_embedding(self, image, content_hash):
+        """Make sure an upload's embedding is in the store, in the background
+        
+        Uploads seen before are a store lookup; new ones go through the feature
+        backbone without delaying the thumbnail. Images without a content_hash
+        (previews, warm-up) are not stored.
+        """
+        if content_hash is None:
+            return
+        if self.content_analyzer.backbone is None or self.content_analyzer.embedding_store is None:
+            return
         
-        # First apply AI enhancements using the model
-        enhanced_image = self.model.predict(img)
+        def store():
+            try:
+                self.content_analyzer.embedding(image, content_hash=content_hash)
+            except Exception as e:
+                print(f"Failed to store image embedding: {e}")
         
-        # Analyze image content
-        content_info = self.content_analyzer.analyze(enhanced_image)
+        self._batch_executor.submit(store)
+    
+    def select_template(self, prompt_properties=None):
+        """Pick the template to use for the given prompt properties"""
+        # An explicit template (e.g. from a variant) wins over the style mapping
+        if prompt_properties and prompt_properties.get('template'):
+            template = self.templates.get(prompt_properties['template'])
+            if template is not None:
+                return template
+        
+        # Templates declare the styles and tones they are designed for
+        prompt_properties = prompt_properties or {}
+        return self.templates.select(prompt_properties.get('style'), prompt_properties.get('tone'))
+    
+    def _compose_thumbnail(self, enhanced_image, prompt_properties, progress=None):
+        """Analyze an enhanced image and apply the matching template"""
+        # Analysis runs lazily, only for what the template actually reads
+        context = self.content_analyzer.context(enhanced_image)
+        self._analyze(context, [prompt_properties])
         
-        # Select template based on prompt properties
-        template_name = "Attractive Thumbnail"  # Default
-        if prompt_properties and "style" in prompt_properties:
-            # Map style to template name
-            style = prompt_properties["style"]
-            if style == "gaming":
-                template_name = "Attractive Thumbnail"  # Could have gaming-specific template
+        if progress:
+            progress('analyzed')
         
-        # Get template or use default
-        template = self.templates.get(template_name, next(iter(self.templates.values())))
+        template = self.select_template(prompt_properties)
         
         # Apply the chosen template (with all our fixes)
-        thumbnail = self._apply_template(enhanced_image, template, prompt_properties)
+        with timed('template'):
+            thumbnail = self._apply_template(enhanced_image, template, prompt_properties, progress, context)
+        
+        if progress:
+            progress('composed', thumbnail)
         
         return thumbnail
     
-    def _apply_template(self, image, template, prompt_properties):
-        """Apply a template to an image with layered compositing"""
+    def _analyze(self, context, properties_list):
+        """Evaluate the parts of an AnalysisContext that composing with each of the properties reads"""
+        with timed('analyze'):
+            for properties in properties_list:
+                if not properties:
+                    continue
+                if properties.get('remove_background'):
+                    if len(context.faces) > 0:
+                        context.foreground
+                elif 'circles' in properties.get('visual_elements', []):
+                    context.faces
+    
+    def _apply_template(self, image, template, prompt_properties, progress=None, context=None):
+        """Apply a template to an image with layered compositing
+        
+        context is the image's AnalysisContext; one is created if not given.
+        """
+        if context is None:
+            context = self.content_analyzer.context(image)
         img = image.copy()
         width, height = img.size
+        # Element sizes are designed for Config.IMAGE_SIZE; previews render them smaller
+        scale = width / Config.IMAGE_SIZE[0]
+        
+        # Static parts of the template, compiled once per canvas size
+        plan = self.render_plans.get(template, img.size, self.templates.version(template['name']))
+        
+        # Full-canvas layers, blended bottom to top in 8-bit RGBA
+        layers = [img]
         
         # ======= REMOVE DUPLICATED BACKGROUND CODE =======
         # We'll use only one background removal implementation
@@ -62,12 +265,12 @@ class ThumbnailGenerator:
         # Background handling - this is the consolidated version
         if prompt_properties and prompt_properties.get("remove_background", False):
             # Extract faces/subjects
-            content_info = self.content_analyzer.analyze(img)
-            faces = content_info['faces']
+            with timed('analyze'):
+                faces = context.faces
             
             if len(faces) > 0:
-                # Apply background removal
-                foreground_elements = self.content_analyzer.remove_background(img)
+                # Apply background removal (shared by every composition of this image)
+                foreground_elements = context.foreground
                 
                 # Determine background color or image
                 background_color = None
@@ -94,42 +297,31 @@ class ThumbnailGenerator:
                 # Create the new background
                 if background_color:
                     # Use specified background color
-                    background = Image.new('RGBA', img.size, background_color)
+                    background = solid(background_color, img.size)
                 else:
-                    # Use dark gradient as default background
-                    background = Image.new('RGBA', img.size, (0, 0, 0, 0))
-                    draw = ImageDraw.Draw(background)
-                    for y in range(height):
-                        # Create gradient from dark to darker
-                        color = (20, 20, 20, 255 - int(y * 0.1))
-                        draw.line([(0, y), (width, y)], fill=color)
+                    # Use dark gradient as default background, fading from opaque to slightly translucent
+                    background = vertical_gradient(img.size, (20, 20, 20, 255), (20, 20, 20, 255 - int((height - 1) * 0.1)))
                 
-                # This is the critical line that was causing the problem:
                 # Composite the foreground OVER the background (order matters!)
-                img = Image.alpha_composite(background, foreground_elements)
-        
-        # Apply overlay elements
-        for element in template['layout']['elements']:
-            if element['type'] == 'overlay':
-                opacity = element.get('opacity', 0.3)
-                color = element.get('color', '#000000')
+                layers = [background, foreground_elements]
                 
-                # Only apply overlay if no custom background was specified
-                if not prompt_properties or not "background" in prompt_properties.get("raw_prompt", "").lower():
-                    # Convert hex color to RGB
-                    r = int(color[1:3], 16)
-                    g = int(color[3:5], 16)
-                    b = int(color[5:7], 16)
-                    
-                    # Create overlay
-                    overlay = Image.new('RGBA', img.size, (r, g, b, int(opacity * 255)))
-                    if img.mode != 'RGBA':
-                        img = img.convert('RGBA')
-                    img = Image.alpha_composite(img, overlay)
+                if progress:
+                    # Flatten early only when someone is watching the intermediate result
+                    img = composite(layers, img.size, 'RGBA')
+                    layers = [img]
+                    progress('background_removed', img)
+        
+        # Apply the prebuilt overlay layer
+        # Only apply overlay if no custom background was specified
+        if plan.overlay is not None:
+            if not prompt_properties or not "background" in prompt_properties.get("raw_prompt", "").lower():
+                layers.append(plan.overlay)
         
         # ======== REST OF THE METHOD REMAINS THE SAME ========
-        # Convert back to RGB for drawing operations
-        img = img.convert('RGB')
+        # Blend everything and convert to RGB once for drawing operations
+        if len(layers) > 1 or img.mode != 'RGB':
+            with timed('composite'):
+                img = composite(layers, img.size)
         draw = ImageDraw.Draw(img)
         
         # Process arrows, text, etc...
@@ -154,9 +346,9 @@ class ThumbnailGenerator:
                         'y': height // 2,
                         'rotation': 180,  # Point left
                         'color': '#FF0000',
-                        'size': 100
+                        'size': int(100 * scale)
                     }
-                    self._draw_arrow(draw, arrow_element)
+                    self._draw_arrow(img, arrow_element)
                 elif char_pos == 'left' and arrow_target == 'right':
                     # Draw arrow pointing from left to right
                     arrow_element = {
@@ -165,9 +357,9 @@ class ThumbnailGenerator:
                         'y': height // 2,
                         'rotation': 0,  # Point right
                         'color': '#FF0000',
-                        'size': 100
+                        'size': int(100 * scale)
                     }
-                    self._draw_arrow(draw, arrow_element)
+                    self._draw_arrow(img, arrow_element)
             elif 'arrow' in prompt_properties['positions']:
                 arrow_position = prompt_properties['positions']['arrow']
                 
@@ -193,22 +385,25 @@ class ThumbnailGenerator:
                         'y': pos['y'],
                         'rotation': pos['rotation'],
                         'color': '#FF0000',
-                        'size': 80
+                        'size': int(80 * scale)
                     }
-                    self._draw_arrow(draw, element)
+                    self._draw_arrow(img, element)
         
         # Add other template elements (if not overridden by prompt)
         else:
-            for element in template['layout']['elements']:
-                if element['type'] == 'arrow':
-                    self._draw_arrow(draw, element)
-                elif element['type'] == 'shape' and element['shape'] != 'overlay':
-                    self._draw_shape(draw, element)
+            for arrow in plan.arrows:
+                self._paste_arrow(img, arrow)
+            for rectangle in plan.rectangles:
+                draw.rectangle(rectangle.box, fill=rectangle.color)
+        
+        # Spotlight circles requested in the prompt
+        if prompt_properties and 'circles' in prompt_properties.get('visual_elements', []):
+            self._draw_circles(img, context, scale)
         
         # Add text with proper alignment if specified in prompt
         if prompt_properties and 'text_overlay' in prompt_properties and prompt_properties['text_overlay']:
-            # Get text areas from template
-            text_areas = template['layout']['textAreas']
+            # Get text areas from template (copied, since compositions run concurrently)
+            text_areas = [dict(area) for area in plan.text_areas]
             
             # Modify text area based on positioning instructions
             if 'positions' in prompt_properties and 'text' in prompt_properties['positions']:
@@ -229,9 +424,12 @@ class ThumbnailGenerator:
             
             # Add alignment information
             text_areas[0]['align'] = prompt_properties.get('text_alignment', 'center')
+            if prompt_properties.get('text_color'):
+                text_areas[0]['color'] = parse_color(prompt_properties['text_color'])
             
             # Draw the text
-            self._add_text(draw, prompt_properties['text_overlay'], text_areas)
+            with timed('text'):
+                self._add_text(img, prompt_properties['text_overlay'], text_areas)
         
         return img
     
@@ -278,68 +476,29 @@ class ThumbnailGenerator:
             draw.line([spiral_points[i-1], spiral_points[i]], 
                      fill=(255, 0, 0, alpha), width=5)
     
-    def _draw_arrow(self, draw, element):
+    def _draw_arrow(self, img, element):
         """Draw a customizable arrow on the image"""
-        # Get arrow properties with more customization options
-        x, y = element['x'], element['y']
-        
-        # Color with fallback and support for hex values
-        color = element.get('color', '#FF0000')
-        if isinstance(color, str) and color.startswith('#'):
-            r = int(color[1:3], 16)
-            g = int(color[3:5], 16)
-            b = int(color[5:7], 16)
-            color = (r, g, b)
-        
-        rotation = element.get('rotation', 0)
-        size = element.get('size', 100)  # Make arrows bigger by default
-        thickness = element.get('thickness', 1.5)  # Thicker arrows
-        
-        # Scale points based on thickness
-        wing_width = int(size//3 * thickness)
-        
-        # Define arrow points for larger, more visible arrow
-        points = [
-            (x, y - size//2),  # Top point
-            (x - wing_width, y + size//2),  # Bottom left
-            (x - wing_width//2, y + size//4),  # Bottom middle left indent
-            (x - wing_width//2, y + size//2),  # Bottom left corner
-            (x + wing_width//2, y + size//2),  # Bottom right corner
-            (x + wing_width//2, y + size//4),  # Bottom middle right indent
-            (x + wing_width, y + size//2),  # Bottom right
-        ]
-        
-        # Rotate points for arrow direction
-        if rotation:
-            # Convert rotation to radians
-            angle_rad = rotation * (3.14159 / 180)
-            cos_angle = np.cos(angle_rad)
-            sin_angle = np.sin(angle_rad)
-            
-            # Rotate around (x, y)
-            rotated_points = []
-            for px, py in points:
-                tx, ty = px - x, py - y
-                rx = tx * cos_angle - ty * sin_angle
-                ry = tx * sin_angle + ty * cos_angle
-                rotated_points.append((rx + x, ry + y))
-            points = rotated_points
-        
-        # Draw the arrow with a visible outline - with stronger colors
-        if isinstance(color, tuple):
-            # RGB color
-            fill_color = color
-            outline_color = (0, 0, 0)
+        self._paste_arrow(img, element_arrow(element))
+    
+    def _paste_arrow(self, img, arrow):
+        """Paste the antialiased sprite for an arrow, outline included"""
+        self.sprites.paste(img, 'arrow', (arrow.x, arrow.y), arrow.size, arrow.rotation,
+                           arrow.color, arrow.thickness)
+    
+    def _draw_circles(self, img, context, scale=1.0):
+        """Ring the most prominent face (or the center) with a spotlight glow behind it"""
+        width, height = img.size
+        faces = context.faces
+        if len(faces) > 0:
+            x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+            center = (x + w // 2, y + h // 2)
+            diameter = int(max(w, h) * 1.6)
         else:
-            # String color like '#FF0000'
-            fill_color = color
-            outline_color = "#000000"
-        
-        # Draw fill
-        draw.polygon(points, fill=fill_color)
-        
-        # Draw thick outline for better visibility
-        draw.line([points[-1], points[0]] + points, fill=outline_color, width=3)
+            center = (width // 2, height // 2)
+            diameter = height // 2
+        self.sprites.paste(img, 'spotlight', center, int(diameter * 1.4), color=(255, 255, 220))
+        self.sprites.paste(img, 'circle', center, diameter, color=(255, 220, 0),
+                           thickness=max(2, int(6 * scale)))
     
     def _draw_shape(self, draw, element):
         """Draw a shape on the image"""
@@ -350,8 +509,8 @@ class ThumbnailGenerator:
             )
         # Other shapes...
     
-    def _add_text(self, draw, text, text_areas):
-        """Add text to the image with enhanced styling"""
+    def _add_text(self, img, text, text_areas):
+        """Add text to the image with enhanced styling, wrapped and sized to fit its area"""
         if not text_areas or not text:
             return
         
@@ -359,79 +518,46 @@ class ThumbnailGenerator:
         text_area = text_areas[0]
         font_size = text_area.get('fontSize', 60)
         text_align = text_area.get('align', 'center')
-        is_bold = 'bold' in text_area.get('style', '').lower()
-        is_italic = 'italic' in text_area.get('style', '').lower()
-        
-        # Try to use Google Fonts if available
-        font = None
-        try:
-            # Modern eye-catching YouTube fonts
-            youtube_fonts = [
-                'Montserrat-Bold.ttf',
-                'Roboto-Black.ttf',
-                'OpenSans-ExtraBold.ttf',
-                'Poppins-Bold.ttf',
-                os.path.join(Config.FONTS_PATH, 'Montserrat-Bold.ttf'),
-                os.path.join(Config.FONTS_PATH, 'Roboto-Black.ttf'),
-                'C:\\Windows\\Fonts\\Arial.ttf'
-            ]
-            
-            # Try each font until one works
-            for font_path in youtube_fonts:
-                try:
-                    font = ImageFont.truetype(font_path, font_size)
-                    break
-                except Exception:
-                    continue
-        except Exception:
-            pass
-            
-        # Fallback to default if no Google Font was loaded
-        if font is None:
-            font = ImageFont.load_default()
-        
-        # Calculate text position
-        try:
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
-        except AttributeError:
-            text_width, text_height = draw.textsize(text, font=font)
-        
-        # Get position and apply alignment
+        stroke_width = text_area.get('strokeWidth', 4)
+        canvas_width, canvas_height = img.size
+        
+        # Get position
         x = text_area['x']
         y = text_area['y']
         
-        # Calculate position based on alignment and placement
+        # Keep the area on the canvas, whichever way it is anchored
+        max_width = text_area.get('width', canvas_width)
         if text_align == 'center':
-            x -= (text_width // 2)
+            max_width = min(max_width, 2 * min(x, canvas_width - x))
         elif text_align == 'right':
-            x -= text_width
-        
-        # Get text colors
-        stroke_width = text_area.get('strokeWidth', 4)
-        stroke_color = text_area.get('strokeColor', '#000000')
-        text_color = text_area.get('color', '#FFFFFF')
-        
-        # Convert hex colors to RGB
-        if isinstance(stroke_color, str) and stroke_color.startswith('#'):
-            r = int(stroke_color[1:3], 16)
-            g = int(stroke_color[3:5], 16)
-            b = int(stroke_color[5:7], 16)
-            stroke_color = (r, g, b)
-        
-        if isinstance(text_color, str) and text_color.startswith('#'):
-            r = int(text_color[1:3], 16)
-            g = int(text_color[3:5], 16)
-            b = int(text_color[5:7], 16)
-            text_color = (r, g, b)
+            max_width = min(max_width, x)
+        else:
+            max_width = min(max_width, canvas_width - x)
+        max_lines = text_area.get('maxLines', 2)
+        max_height = text_area.get('height', max_lines * self.text_renderer.line_height(font_size))
+        
+        # Largest size (up to the template's fontSize) whose wrapped lines fit the area
+        min_size = max(8, int(Config.MIN_FONT_SIZE * canvas_width / Config.IMAGE_SIZE[0]))
+        font_size, lines = self.text_renderer.fit(text, max_width, max_height, font_size,
+                                                  min_size=min_size, stroke_width=stroke_width)
+        line_height = self.text_renderer.line_height(font_size)
+        
+        # Move the block up if its last line would fall off the bottom of the canvas
+        y = max(0, min(y, canvas_height - len(lines) * line_height - stroke_width))
+        
+        # Get text colors (template colors arrive pre-parsed)
+        stroke_color = parse_color(text_area.get('strokeColor', '#000000'))
+        text_color = parse_color(text_area.get('color', '#FFFFFF'))
+        
+        for index, line in enumerate(lines):
+            # Calculate position based on alignment and placement
+            text_width, _ = self.text_renderer.text_size(line, font_size)
+            line_x = x
+            if text_align == 'center':
+                line_x -= (text_width // 2)
+            elif text_align == 'right':
+                line_x -= text_width
             
-        # Draw outline for better visibility - using more points for better coverage
-        for offset_x in range(-stroke_width, stroke_width+1, 1):
-            for offset_y in range(-stroke_width, stroke_width+1, 1):
-                if offset_x == 0 and offset_y == 0:
-                    continue
-                if abs(offset_x) + abs(offset_y) <= stroke_width + 1:
-                    draw.text((x + offset_x, y + offset_y), text, font=font, fill=stroke_color)
-        
-        # Draw main text with a slight shadow for depth
-        draw.text((x, y), text, font=font, fill=text_color)
\ No newline at end of file
+            # Stroke and fill are rasterized together once, then reused for repeated titles
+            self.text_renderer.draw(img, (line_x, y + index * line_height), line, font_size,
+                                    text_color, stroke_width, stroke_color)
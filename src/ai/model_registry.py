@@ -0,0 +1,90 @@
+import math
+import os
+import threading
+import time
+
+
+def model_bytes(model):
+    """Approximate memory held by a model's weights, or None if the model does not expose them"""
+    variables = getattr(model, 'weights', None) or getattr(model, 'variables', None)
+    if not variables:
+        return None
+    try:
+        return int(sum(math.prod(tuple(variable.shape)) * variable.dtype.size for variable in variables))
+    except (AttributeError, TypeError):
+        return None
+
+
+class ModelRegistry:
+    """Models loaded at most once per process and shared by every request
+
+    get(name, loader) returns the loaded model, calling loader() the first
+    time a name is asked for; concurrent first callers wait for that one load
+    instead of loading their own copy. Loaded models are read without taking
+    a lock. A loader may return None for a model that is not available, and
+    that answer is remembered too.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._loaders = {}
+        self._info = {}
+        self._reset_locks()
+        # A lock held by another thread during fork() would stay locked in the child
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_locks)
+
+    def _reset_locks(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def register(self, name, loader):
+        """Set the loader for a model; it runs on the first get()"""
+        with self._lock:
+            self._loaders[name] = loader
+
+    def get(self, name, loader=None):
+        """Return a model, loading it first if needed (with loader, or the registered one)"""
+        try:
+            return self._models[name]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if loader is not None:
+                self._loaders.setdefault(name, loader)
+            loader = self._loaders.get(name)
+            lock = self._locks.setdefault(name, threading.Lock())
+        if loader is None:
+            raise KeyError(f"No loader registered for model '{name}'")
+
+        with lock:
+            if name not in self._models:
+                start = time.perf_counter()
+                model = loader()
+                self._info[name] = {
+                    'load_seconds': round(time.perf_counter() - start, 3),
+                    'loaded_at': time.time()
+                }
+                self._models[name] = model
+        return self._models[name]
+
+    def loaded(self, name):
+        return name in self._models
+
+    def stats(self):
+        """Which models are loaded in this process, how long they took to load and their weight memory"""
+        with self._lock:
+            names = sorted(set(self._loaders) | set(self._models))
+        stats = {}
+        for name in names:
+            if name not in self._models:
+                stats[name] = {'loaded': False}
+                continue
+            model = self._models[name]
+            stats[name] = dict(self._info.get(name, {}), loaded=True, available=model is not None,
+                               bytes=model_bytes(model))
+        return stats
+
+
+registry = ModelRegistry()
@@ -9,11 +9,14 @@ from tensorflow.keras.preprocessing.image import load_img, img_to_array
 from PIL import Image
 import time
 from src.utils.database import ThumbnailDatabase
+from src.utils.file_handler import FileStore
 from src.config.settings import Config
 
 class ModelTrainer:
     def __init__(self):
         self.db = ThumbnailDatabase()
+        self.upload_store = FileStore('uploads', writer=None)
+        self.thumbnail_store = FileStore(Config.OUTPUT_PATH, writer=None)
         self.batch_size = 16
         self.img_height = 720
         self.img_width = 1280
@@ -36,21 +39,11 @@ class ModelTrainer:
         output_images = []
         
         for item in highly_rated:
-            # Get original and thumbnail paths
-            thumb_path = item['thumbnail_path']
-            if thumb_path.startswith('/'):
-                thumb_path = thumb_path[1:]  # Remove leading slash
-                
-            # Get the original path
-            # The database stores the web path, convert to filesystem path
-            original_path = thumb_path.replace('thumbnails', 'uploads')
-            original_path = original_path.replace('ai_thumbnail_', '')
-                
-            # Load images if they exist
-            full_thumb_path = os.path.join(Config.OUTPUT_PATH, os.path.basename(thumb_path))
-            full_orig_path = os.path.join('uploads', os.path.basename(original_path))
+            # The database stores web paths; files live in hashed subdirectories
+            full_thumb_path = self.thumbnail_store.locate(os.path.basename(item['thumbnail_path']))
+            full_orig_path = self.upload_store.locate(os.path.basename(item['original_path'] or ''))
             
-            if os.path.exists(full_thumb_path) and os.path.exists(full_orig_path):
+            if full_thumb_path and full_orig_path:
                 # Load and preprocess images
                 try:
                     # Input is the original image
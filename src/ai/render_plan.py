@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict, namedtuple
+from src.config.settings import Config
+from src.image_processing.compositing import composite, solid
+
+# Everything a template draws that does not depend on the request, for one canvas size
+RenderPlan = namedtuple('RenderPlan', ['name', 'size', 'overlay', 'arrows', 'rectangles', 'text_areas'])
+Arrow = namedtuple('Arrow', ['x', 'y', 'rotation', 'size', 'thickness', 'color'])
+Rectangle = namedtuple('Rectangle', ['box', 'color'])
+
+
+def parse_color(color):
+    """Convert a '#RRGGBB' string to an RGB tuple; other values are returned unchanged"""
+    if isinstance(color, str) and color.startswith('#') and len(color) >= 7:
+        return (int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16))
+    return color
+
+
+def element_arrow(element, scale=1.0):
+    """Build the Arrow for a template or prompt arrow element, scaling its position and size"""
+    return Arrow(int(element['x'] * scale), int(element['y'] * scale), element.get('rotation', 0),
+                 max(1, int(element.get('size', 100) * scale)), element.get('thickness', 1.5),
+                 parse_color(element.get('color', '#FF0000')))
+
+
+def compile_template(template, size):
+    """Compile a template definition into a RenderPlan for a canvas size
+
+    Template coordinates, font sizes and stroke widths are in the template's
+    design size (its imagePosition, or Config.IMAGE_SIZE) and are scaled to the
+    canvas, so the same template renders full-size thumbnails and previews.
+    """
+    layout = template['layout']
+    elements = layout['elements']
+    design = layout.get('imagePosition', {})
+    scale_x = size[0] / design.get('width', Config.IMAGE_SIZE[0])
+    scale_y = size[1] / design.get('height', Config.IMAGE_SIZE[1])
+
+    # Overlays are combined into one RGBA layer here, so renders blend a single precomputed layer
+    overlays = []
+    for element in elements:
+        if element['type'] == 'overlay':
+            r, g, b = parse_color(element.get('color', '#000000'))
+            overlays.append(solid((r, g, b, int(element.get('opacity', 0.3) * 255)), size))
+
+    arrows = tuple(element_arrow(element, scale_x) for element in elements if element['type'] == 'arrow')
+    rectangles = tuple(
+        Rectangle((int(element['x'] * scale_x), int(element['y'] * scale_y),
+                   int((element['x'] + element['width']) * scale_x), int((element['y'] + element['height']) * scale_y)),
+                  element['color'])
+        for element in elements
+        if element['type'] == 'shape' and element['shape'] == 'rectangle')
+
+    text_areas = []
+    for area in layout.get('textAreas', []):
+        area = dict(area)
+        for key, scale in (('x', scale_x), ('width', scale_x), ('y', scale_y), ('height', scale_y)):
+            if key in area:
+                area[key] = int(area[key] * scale)
+        area['fontSize'] = max(1, int(area.get('fontSize', 60) * scale_x))
+        stroke_width = area.get('strokeWidth', 4)
+        area['strokeWidth'] = max(1, int(round(stroke_width * scale_x))) if stroke_width else 0
+        for key in ('color', 'strokeColor'):
+            if key in area:
+                area[key] = parse_color(area[key])
+        text_areas.append(area)
+
+    overlay = composite(overlays, size, 'RGBA') if overlays else None
+
+    return RenderPlan(template['name'], tuple(size), overlay, arrows, rectangles, tuple(text_areas))
+
+
+class RenderPlanCache:
+    """Compiled render plans keyed by template name, version and canvas size
+
+    The version is the template registry's content hash, so a plan is
+    rebuilt when the registry reloads a changed template.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, template, size, version=None):
+        """Return the plan for template at size, compiling it if this version has not been seen"""
+        key = (template['name'], version, tuple(size))
+
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+
+        plan = compile_template(template, size)
+
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+        return plan
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+
+ELEMENT_FIELDS = {
+    'arrow': ('x', 'y'),
+    'overlay': (),
+    'shape': ('shape',)
+}
+
+# An immutable view of the template folder; reloads build a new one and swap it in
+TemplateSnapshot = namedtuple('TemplateSnapshot', ['templates', 'paths', 'versions', 'index', 'default',
+                                                   'files', 'parsed'])
+
+EMPTY_SNAPSHOT = TemplateSnapshot({}, {}, {}, {}, None, {}, {})
+
+
+def template_version(template):
+    """A short hash of a template's content, which changes whenever the template is edited"""
+    content = json.dumps(template, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(content).hexdigest()[:16]
+
+
+class TemplateError(ValueError):
+    """Raised when a template definition is malformed"""
+
+
+def validate_template(template):
+    """Check the structure the renderer relies on, raising TemplateError on the first problem"""
+    if not isinstance(template, dict):
+        raise TemplateError('template must be a JSON object')
+    if not isinstance(template.get('name'), str) or not template['name']:
+        raise TemplateError('template needs a non-empty name')
+
+    layout = template.get('layout')
+    if not isinstance(layout, dict) or not isinstance(layout.get('elements'), list):
+        raise TemplateError('layout.elements must be a list')
+
+    for element in layout['elements']:
+        if not isinstance(element, dict) or element.get('type') not in ELEMENT_FIELDS:
+            raise TemplateError(f'unknown element: {element!r}')
+        fields = ELEMENT_FIELDS[element['type']]
+        if element['type'] == 'shape' and element.get('shape') == 'rectangle':
+            fields = ('x', 'y', 'width', 'height', 'color')
+        missing = [field for field in fields if field not in element]
+        if missing:
+            raise TemplateError(f"{element['type']} element is missing {', '.join(missing)}")
+
+    text_areas = layout.get('textAreas', [])
+    if not isinstance(text_areas, list) or not all(isinstance(area, dict) and 'x' in area and 'y' in area
+                                                   for area in text_areas):
+        raise TemplateError('textAreas must be a list of areas with x and y')
+
+    for key in ('styles', 'tones'):
+        values = template.get(key, [])
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            raise TemplateError(f'{key} must be a list of strings')
+
+
+class TemplateRegistry:
+    """Templates from a folder of JSON files, indexed by name, style and tone
+
+    Readers only ever dereference the current snapshot, so lookups take no
+    lock and are plain dict reads. Every check_interval seconds a background
+    thread compares the folder's file modification times with the snapshot's;
+    if anything changed, it reloads the changed files and swaps in a new
+    snapshot. With no check_interval, changes are only picked up by reload().
+    Templates that fail validation are skipped with a warning.
+    """
+
+    def __init__(self, folder, check_interval=2.0, default_name=None):
+        self.folder = folder
+        self.check_interval = check_interval
+        self.default_name = default_name
+        self._snapshot = EMPTY_SNAPSHOT
+        self._stopped = threading.Event()
+        self._start()
+        self.reload()
+        # Threads do not survive fork(), so pre-forked workers need their own watcher
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._reload_lock = threading.Lock()
+        self._thread = None
+        if self.check_interval and not self._stopped.is_set():
+            self._thread = threading.Thread(target=self._watch, name='template-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop watching the folder for changes"""
+        self._stopped.set()
+
+    def get(self, name):
+        """Return the template called name, or None"""
+        return self._snapshot.templates.get(name)
+
+    def path(self, name):
+        """Return the file a template was loaded from, or None"""
+        return self._snapshot.paths.get(name)
+
+    def version(self, name):
+        """Return the content hash of a template, or None"""
+        return self._snapshot.versions.get(name)
+
+    def select(self, style=None, tone=None):
+        """Return the template declared for style and tone, falling back to style, tone, then the default"""
+        snapshot = self._snapshot
+        for key in ((style, tone), (style, None), (None, tone)):
+            name = snapshot.index.get(key)
+            if name is not None:
+                return snapshot.templates[name]
+        return snapshot.default
+
+    def names(self):
+        return list(self._snapshot.templates)
+
+    def __contains__(self, name):
+        return name in self._snapshot.templates
+
+    def __len__(self):
+        return len(self._snapshot.templates)
+
+    def reload(self):
+        """Re-read changed template files; returns True if the snapshot changed"""
+        with self._reload_lock:
+            return self._reload()
+
+    def _watch(self):
+        while not self._stopped.wait(self.check_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"Template reload failed: {e}")
+
+    def _reload(self):
+        previous = self._snapshot
+
+        files = {}
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.json') and entry.is_file():
+                        stat = entry.stat()
+                        files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError as e:
+            print(f"Could not list templates in {self.folder}: {e}")
+            return False
+
+        if files == previous.files:
+            return False
+
+        # Unchanged files keep their parsed template; only new or modified ones are read
+        parsed = {}
+        for path in sorted(files):
+            if previous.files.get(path) == files[path]:
+                parsed[path] = previous.parsed[path]
+                continue
+            try:
+                with open(path, 'r') as f:
+                    template = json.load(f)
+                validate_template(template)
+            except (OSError, ValueError) as e:
+                print(f"Skipping template {path}: {e}")
+                template = None
+            parsed[path] = template
+
+        self._snapshot = self._build(files, parsed)
+        return True
+
+    def _build(self, files, parsed):
+        templates, paths, versions, index = {}, {}, {}, {}
+        for path in sorted(parsed):
+            template = parsed[path]
+            if template is None:
+                continue
+            name = template['name']
+            if name in templates:
+                print(f"Skipping template {path}: name '{name}' is already used by {paths[name]}")
+                continue
+            templates[name] = template
+            paths[name] = path
+            versions[name] = template_version(template)
+
+            # The first template (by file name) declaring a combination owns it
+            styles = template.get('styles', [])
+            tones = template.get('tones', [])
+            for style in styles:
+                index.setdefault((style, None), name)
+                for tone in tones:
+                    index.setdefault((style, tone), name)
+            for tone in tones:
+                index.setdefault((None, tone), name)
+
+        default = templates.get(self.default_name)
+        if default is None and templates:
+            default = next(iter(templates.values()))
+        return TemplateSnapshot(templates, paths, versions, index, default, files, parsed)
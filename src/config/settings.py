@@ -9,17 +9,109 @@ class Config:
     MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'models', 'enhancement_model')
     STYLE_TRANSFER_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'models', 'style_transfer_model')
     TEMPLATES_PATH = 'data/templates'
+    DEFAULT_TEMPLATE = 'Attractive Thumbnail'  # Used when no template declares the prompt's style or tone
+    TEMPLATE_RELOAD_INTERVAL = float(os.environ.get('THUMBNAIL_TEMPLATE_RELOAD_INTERVAL', 2))  # Seconds between template folder checks
     FONTS_PATH = 'data/fonts'
     OUTPUT_PATH = 'output/thumbnails'
+    
+    # Smaller thumbnail variants rendered alongside every 1280x720 output
+    THUMBNAIL_VARIANTS = {
+        'medium': (640, 360),
+        'small': (320, 180),
+        'mobile': (168, 94)
+    }
+    THUMBNAIL_CACHE_MAX_AGE = 86400  # Seconds browsers may reuse a thumbnail
+    
+    # Output encoding: JPEG, WEBP or PNG (palette-quantized)
+    OUTPUT_FORMAT = os.environ.get('THUMBNAIL_OUTPUT_FORMAT', 'JPEG')
+    OUTPUT_MAX_BYTES = 2 * 1024 * 1024  # YouTube's thumbnail upload limit
+    OUTPUT_MIN_PSNR = 38.0  # Lowest quality whose PSNR (dB) stays above this is used
+    OUTPUT_QUALITY_RANGE = (40, 95)
     FILTERS = ['blur', 'sharpen', 'brightness']
     DEFAULT_FILTER = 'SHARPEN'
     DEFAULT_FONT = 'arial.ttf'
+    SPRITE_ROTATION_STEP = 5  # Degrees between pre-rendered rotations of element sprites
+    MIN_FONT_SIZE = 24  # Smallest size text is shrunk to when fitting a text area
+    
+    # Face detection, text placement and GrabCut run on a proxy of at most this many pixels on its longer side
+    ANALYSIS_PROXY_MAX_SIDE = int(os.environ.get('THUMBNAIL_ANALYSIS_PROXY_MAX_SIDE', 640))
+    ANALYSIS_MASK_RADIUS = 4  # Guided filter window radius (proxy pixels) for upsampling foreground masks
     
     # YouTube-specific settings
     FACE_ENHANCEMENT_STRENGTH = 1.5
     TEXT_STROKE_WIDTH = 2
     BACKGROUND_BLUR_AMOUNT = 2
     
+    # Production server (serve.py) settings
+    SERVER_HOST = os.environ.get('THUMBNAIL_HOST', '0.0.0.0')
+    SERVER_PORT = int(os.environ.get('THUMBNAIL_PORT', 8000))
+    SERVER_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+    PRELOAD_MODELS = True  # Load models when the app is imported; serve.py loads them in each worker instead
+    
+    # Background job settings
+    JOB_WORKERS = int(os.environ.get('THUMBNAIL_JOB_WORKERS', 2))
+    JOB_QUEUE_SIZE = int(os.environ.get('THUMBNAIL_JOB_QUEUE_SIZE', 32))
+    JOB_RESULT_TTL = 3600  # Seconds to keep finished jobs for polling
+    JOB_STORE_PATH = 'data/jobs.db'  # Job status and events shared by all server workers
+    SSE_KEEPALIVE_SECONDS = 15  # Idle time before a progress stream sends a keep-alive
+    PROGRESS_PREVIEW_SIZE = (320, 180)
+    PREVIEW_RENDER_SIZE = (320, 180)  # Canvas for low-resolution preview renders
+    
+    # Admission control: (max concurrent, max waiting) per expensive stage
+    STAGE_LIMITS = {
+        'inference': (int(os.environ.get('THUMBNAIL_INFERENCE_CONCURRENCY', 2)), 8),
+        'analysis': (int(os.environ.get('THUMBNAIL_ANALYSIS_CONCURRENCY', 4)), 16),
+        'background_removal': (int(os.environ.get('THUMBNAIL_GRABCUT_CONCURRENCY', 2)), 8)
+    }
+    STAGE_WAIT_TIMEOUT = 10  # Seconds a request may wait for a stage slot before a 429
+    
+    # A/B variants: overrides applied to the analyzed prompt for each variant
+    VARIANT_PRESETS = [
+        {},
+        {'positions': {'text': 'bottom'}},
+        {'positions': {'text': 'top', 'arrow': 'corner'}},
+        {'positions': {'text': 'bottom', 'arrow': 'left'}, 'text_color': '#FFFF00'},
+        {'positions': {'text': 'center'}, 'text_color': '#FFD700'},
+        {'positions': {'text': 'top', 'arrow': 'right'}, 'text_color': '#00FFFF'},
+        {'positions': {'text': 'bottom', 'arrow': 'top'}, 'text_color': '#FF4040'},
+        {'positions': {'text': 'left', 'arrow': 'right'}}
+    ]
+    MAX_VARIANTS = 8
+    CONTACT_SHEET_TILE_SIZE = (320, 180)
+    CONTACT_SHEET_COLUMNS = 4
+    
+    # Batch generation settings
+    BATCH_SIZE = 8  # Images per enhancement model forward pass
+    # Single-image inferences from concurrent requests are batched for up to this long / this many images
+    MICRO_BATCH_MAX_DELAY = float(os.environ.get('THUMBNAIL_MICRO_BATCH_MAX_DELAY', 0.005))
+    MICRO_BATCH_MAX_SIZE = int(os.environ.get('THUMBNAIL_MICRO_BATCH_MAX_SIZE', 8))
+    MAX_BATCH_IMAGES = 200
+    ANALYSIS_WORKERS = 4
+    
+    # Write-behind persistence of uploads and outputs
+    WRITE_BEHIND_QUEUE_SIZE = 256
+    WRITE_BEHIND_BATCH_SIZE = 32
+    
+    # Retention of uploads/ and output/thumbnails (files recorded in the database are always kept)
+    UPLOAD_RETENTION_SECONDS = 7 * 86400
+    THUMBNAIL_RETENTION_SECONDS = 30 * 86400
+    UPLOAD_STORAGE_MAX_BYTES = 5 * 1024 * 1024 * 1024
+    THUMBNAIL_STORAGE_MAX_BYTES = 5 * 1024 * 1024 * 1024
+    STORAGE_COMPACTION_INTERVAL = 3600  # Seconds between background compaction passes
+    STORAGE_COMPACTION_LOCK = 'data/storage-compaction.lock'
+    
+    # Generated thumbnail cache
+    RESULT_CACHE_PATH = 'data/cache/results'
+    RESULT_CACHE_MEMORY_BYTES = 256 * 1024 * 1024
+    RESULT_CACHE_DISK_BYTES = 2 * 1024 * 1024 * 1024
+    
+    # Feature backbone for image embeddings: 'mobilenet', 'resnet50' or 'none'
+    FEATURE_BACKBONE = os.environ.get('THUMBNAIL_FEATURE_BACKBONE', 'resnet50')
+    
+    # Pooled backbone features, keyed by image content hash (one store per backbone)
+    EMBEDDING_STORE_PATH = 'data/embeddings'
+    EMBEDDING_SHARD_ROWS = 65536  # float16 vectors per memory-mapped .npy shard
+    
     # Common YouTube thumbnail text positions
     TEXT_POSITIONS = {
         'top': {'x': 0.5, 'y': 0.2},
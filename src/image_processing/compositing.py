@@ -0,0 +1,49 @@
+from functools import lru_cache
+import numpy as np
+from PIL import Image
+
+
+def solid(color, size):
+    """A full-canvas RGBA layer of one RGB or RGBA color"""
+    rgba = tuple(color) + (255,) * (4 - len(color))
+    return Image.new('RGBA', size, rgba)
+
+
+@lru_cache(maxsize=16)
+def vertical_gradient(size, top, bottom):
+    """An RGBA layer fading linearly from the top RGBA color to the bottom one
+
+    Only one column is computed and stretched across the canvas. Layers are
+    cached by size and colors, so callers must not draw on them.
+    """
+    width, height = size
+    t = np.linspace(0.0, 1.0, height, dtype=np.float32).reshape(height, 1, 1)
+    top = np.array(top, dtype=np.float32).reshape(1, 1, 4)
+    bottom = np.array(bottom, dtype=np.float32).reshape(1, 1, 4)
+    column = (top + (bottom - top) * t + 0.5).astype(np.uint8)
+    return Image.fromarray(column, 'RGBA').resize((width, height), Image.NEAREST)
+
+
+def composite(layers, size, mode='RGB'):
+    """Blend PIL layers bottom to top with the 'over' operator, staying in 8-bit RGBA
+
+    Opaque (RGB) layers hide everything below them, so blending starts at the
+    topmost one. Constant layers, such as a render plan's overlays, should be
+    combined once with composite(..., 'RGBA') and reused. Like
+    Image.alpha_composite, RGB output keeps the straight color of translucent
+    pixels. When nothing needs blending, a layer may be returned as it is.
+    """
+    out = None
+    for layer in layers:
+        if layer.size != tuple(size):
+            raise ValueError(f"Layer size {layer.size} does not match canvas size {tuple(size)}")
+        if out is None or layer.mode == 'RGB':
+            out = layer
+            continue
+        if out.mode != 'RGBA':
+            out = out.convert('RGBA')
+        out = Image.alpha_composite(out, layer if layer.mode == 'RGBA' else layer.convert('RGBA'))
+
+    if out is None:
+        return Image.new(mode, size)
+    return out if out.mode == mode else out.convert(mode)
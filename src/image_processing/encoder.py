@@ -0,0 +1,147 @@
+import io
+import numpy as np
+from PIL import Image
+
+OUTPUT_EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp', 'PNG': '.png'}
+
+
+def encode(image, image_format, quality=None):
+    """Encode an image with the optimized settings used for served thumbnails
+
+    quality is the JPEG/WebP quality, or the palette size for PNG (None keeps
+    PNG lossless).
+    """
+    buffer = io.BytesIO()
+    image = image.convert('RGB')
+    if image_format == 'JPEG':
+        image.save(buffer, format='JPEG', quality=quality, optimize=True, progressive=True)
+    elif image_format == 'WEBP':
+        image.save(buffer, format='WEBP', quality=quality, method=4)
+    elif quality is None:
+        image.save(buffer, format='PNG', optimize=True)
+    else:
+        image.quantize(colors=quality).save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def psnr(reference, data):
+    """Peak signal-to-noise ratio in dB between a reference array and encoded image bytes"""
+    decoded = np.asarray(Image.open(io.BytesIO(data)).convert('RGB'), dtype=np.float32)
+    mse = np.mean((reference - decoded) ** 2)
+    if mse == 0:
+        return float('inf')
+    return float(10 * np.log10(255.0 ** 2 / mse))
+
+
+def _lowest_passing(low, high, passes):
+    """Binary search the lowest value in [low, high] for which passes() holds, or None"""
+    found = None
+    while low <= high:
+        middle = (low + high) // 2
+        if passes(middle):
+            found = middle
+            high = middle - 1
+        else:
+            low = middle + 1
+    return found
+
+
+def _highest_passing(low, high, passes):
+    """Binary search the highest value in [low, high] for which passes() holds, or None"""
+    found = None
+    while low <= high:
+        middle = (low + high) // 2
+        if passes(middle):
+            found = middle
+            low = middle + 1
+        else:
+            high = middle - 1
+    return found
+
+
+class OutputEncoder:
+    """Encodes thumbnails at the lowest quality that meets a quality target and byte budget
+
+    Quality (or palette size for PNG) is binary searched: first for the lowest
+    setting whose PSNR reaches min_psnr, then down from there until the output
+    fits in max_bytes. Either target may be None to skip that search. An image
+    that does not fit even at the lowest setting is downscaled until it does.
+    """
+
+    def __init__(self, image_format='JPEG', max_bytes=None, min_psnr=None, quality_range=(40, 95),
+                 palette_range=(16, 256)):
+        image_format = image_format.upper()
+        if image_format == 'JPG':
+            image_format = 'JPEG'
+        if image_format not in OUTPUT_EXTENSIONS:
+            raise ValueError(f"Unsupported output format: {image_format}")
+        self.image_format = image_format
+        self.extension = OUTPUT_EXTENSIONS[image_format]
+        self.max_bytes = max_bytes
+        self.min_psnr = min_psnr
+        self.quality_range = palette_range if image_format == 'PNG' else quality_range
+
+    def encode(self, image):
+        """Return the encoded bytes and the parameters chosen for them"""
+        encoded = {}
+        scores = {}
+        reference = None
+
+        def attempt(quality):
+            if quality not in encoded:
+                encoded[quality] = encode(image, self.image_format, quality)
+            return encoded[quality]
+
+        def score(quality):
+            nonlocal reference
+            if quality not in scores:
+                if reference is None:
+                    reference = np.asarray(image.convert('RGB'), dtype=np.float32)
+                scores[quality] = psnr(reference, attempt(quality))
+            return scores[quality]
+
+        low, high = self.quality_range
+        quality = high
+        if self.min_psnr is not None:
+            quality = _lowest_passing(low, high, lambda q: score(q) >= self.min_psnr)
+            if quality is None:
+                # Not even the top setting reaches the target; PNG can still go lossless
+                quality = None if self.image_format == 'PNG' else high
+
+        if self.max_bytes is not None and len(attempt(quality)) > self.max_bytes:
+            upper = high if quality is None else quality
+            fitting = _highest_passing(low, upper, lambda q: len(attempt(q)) <= self.max_bytes)
+            if fitting is None:
+                return self._downscale_to_fit(image, low, attempt(low), len(encoded))
+            quality = fitting
+
+        data = attempt(quality)
+        parameters = {'format': self.image_format, 'bytes': len(data), 'attempts': len(encoded)}
+        if self.image_format == 'PNG':
+            parameters['colors'] = quality
+        else:
+            parameters['quality'] = quality
+        if quality in scores and scores[quality] != float('inf'):
+            parameters['psnr'] = round(scores[quality], 2)
+        return data, parameters
+
+    def encode_like(self, image, parameters):
+        """Encode an image with the setting encode() chose for another one, skipping the search"""
+        return encode(image, self.image_format, parameters.get('colors' if self.image_format == 'PNG' else 'quality'))
+
+    def _downscale_to_fit(self, image, quality, data, attempts):
+        """Shrink an image encoded at the lowest setting until it fits in max_bytes"""
+        width, height = image.size
+        while len(data) > self.max_bytes:
+            # Encoded size grows roughly with the pixel count
+            scale = 0.9 * (self.max_bytes / len(data)) ** 0.5
+            width, height = int(width * scale), int(height * scale)
+            if width < 1 or height < 1:
+                raise ValueError(f"Image cannot be encoded in {self.max_bytes} bytes")
+            data = encode(image.resize((width, height), Image.LANCZOS), self.image_format, quality)
+            attempts += 1
+        print(f"Thumbnail downscaled to {width}x{height} to fit in {self.max_bytes} bytes")
+        parameters = {'format': self.image_format, 'bytes': len(data), 'attempts': attempts,
+                      'size': [width, height]}
+        parameters['colors' if self.image_format == 'PNG' else 'quality'] = quality
+        return data, parameters
@@ -1,4 +1,28 @@
 def resize_image(image, size):
     from PIL import Image
     resized_image = image.resize(size, Image.LANCZOS)
-    return resized_image
\ No newline at end of file
+    return resized_image
+
+def resize_variants(image, sizes):
+    """Downscale an image to several named sizes, reusing each result for the next smaller one"""
+    from PIL import Image
+    variants = {}
+    source = image
+    for name, size in sorted(sizes.items(), key=lambda item: item[1][0] * item[1][1], reverse=True):
+        source = source.resize(size, Image.LANCZOS)
+        variants[name] = source
+    return variants
+
+def contact_sheet(images, tile_size, columns=4, padding=8, background=(24, 24, 24)):
+    """Lay downscaled copies of images out in a grid on one preview image"""
+    from PIL import Image
+    columns = max(1, min(columns, len(images)))
+    rows = (len(images) + columns - 1) // columns
+    tile_width, tile_height = tile_size
+    sheet = Image.new('RGB', (columns * (tile_width + padding) + padding,
+                              rows * (tile_height + padding) + padding), background)
+    for index, image in enumerate(images):
+        row, column = divmod(index, columns)
+        tile = image.convert('RGB').resize(tile_size, Image.LANCZOS)
+        sheet.paste(tile, (padding + column * (tile_width + padding), padding + row * (tile_height + padding)))
+    return sheet
@@ -0,0 +1,130 @@
+import math
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw
+
+# Sprites are drawn this many times larger, then downscaled for antialiasing
+SUPERSAMPLE = 4
+
+
+def _rgb(color):
+    return ImageColor.getrgb(color) if isinstance(color, str) else tuple(color[:3])
+
+
+def arrow_polygon(x, y, rotation=0, size=100, thickness=1.5):
+    """Outline points of an arrow with its tip at (x, y) before rotation about that point"""
+    # Scale points based on thickness
+    wing_width = int(size//3 * thickness)
+
+    # Define arrow points for larger, more visible arrow
+    points = np.array([
+        (x, y - size//2),  # Top point
+        (x - wing_width, y + size//2),  # Bottom left
+        (x - wing_width//2, y + size//4),  # Bottom middle left indent
+        (x - wing_width//2, y + size//2),  # Bottom left corner
+        (x + wing_width//2, y + size//2),  # Bottom right corner
+        (x + wing_width//2, y + size//4),  # Bottom middle right indent
+        (x + wing_width, y + size//2),  # Bottom right
+    ], dtype=np.float64)
+
+    # Rotate all points around (x, y) at once
+    if rotation:
+        angle_rad = math.radians(rotation)
+        cos_angle, sin_angle = math.cos(angle_rad), math.sin(angle_rad)
+        rotation_matrix = np.array([[cos_angle, sin_angle], [-sin_angle, cos_angle]])
+        points = (points - (x, y)) @ rotation_matrix + (x, y)
+
+    return [tuple(point) for point in points.tolist()]
+
+
+def render_arrow(size, rotation, color, thickness):
+    """Filled arrow with a black outline; the anchor is the point it rotates about"""
+    scaled = size * SUPERSAMPLE
+    outline = 3 * SUPERSAMPLE
+    wing_width = int(scaled // 3 * thickness)
+    radius = int(math.hypot(wing_width, scaled / 2)) + outline + SUPERSAMPLE
+    center = radius
+
+    sprite = Image.new('RGBA', (2 * radius, 2 * radius), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(sprite)
+    points = arrow_polygon(center, center, rotation, scaled, thickness)
+    draw.polygon(points, fill=color + (255,))
+    draw.line([points[-1], points[0]] + points, fill=(0, 0, 0, 255), width=outline)
+    return sprite, (center, center)
+
+
+def render_circle(size, rotation, color, thickness):
+    """Ring of diameter size, anchored at its center"""
+    scaled = size * SUPERSAMPLE
+    width = max(1, int(thickness * SUPERSAMPLE))
+    sprite = Image.new('RGBA', (scaled + 2 * width, scaled + 2 * width), color + (0,))
+    draw = ImageDraw.Draw(sprite)
+    draw.ellipse([width, width, width + scaled, width + scaled], outline=color + (255,), width=width)
+    center = scaled // 2 + width
+    return sprite, (center, center)
+
+
+def render_spotlight(size, rotation, color, thickness):
+    """Soft radial glow of diameter size that fades out towards its edge, anchored at its center"""
+    scaled = size * SUPERSAMPLE
+    radius = scaled / 2
+    yy, xx = np.mgrid[0:scaled, 0:scaled]
+    falloff = np.clip(1.0 - np.hypot(xx - radius, yy - radius) / radius, 0.0, 1.0) ** 1.5
+    sprite = Image.new('RGBA', (scaled, scaled), color + (0,))
+    sprite.putalpha(Image.fromarray((falloff * 160).astype(np.uint8)))
+    return sprite, (scaled // 2, scaled // 2)
+
+
+RENDERERS = {
+    'arrow': render_arrow,
+    'circle': render_circle,
+    'spotlight': render_spotlight
+}
+
+
+class SpriteAtlas:
+    """Antialiased RGBA sprites for visual elements, rendered once and pasted from then on
+
+    Sprites are keyed by (kind, size, rotation bucket, color, thickness) and
+    generated lazily by the renderer registered for the kind. Rotations are
+    snapped to rotation_step degrees so a handful of sprites cover every angle.
+    """
+
+    def __init__(self, rotation_step=5, max_sprites=512, renderers=None):
+        self.rotation_step = rotation_step
+        self.max_sprites = max_sprites
+        self.renderers = dict(RENDERERS if renderers is None else renderers)
+        self._sprites = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, kind, renderer):
+        """Add an element type; renderer(size, rotation, color, thickness) returns (sprite, anchor)
+        at SUPERSAMPLE times the final size"""
+        self.renderers[kind] = renderer
+
+    def get(self, kind, size, rotation=0, color=(255, 0, 0), thickness=1.5):
+        """Return (sprite, anchor) for an element"""
+        rotation = int(round(rotation / self.rotation_step) * self.rotation_step) % 360
+        key = (kind, int(size), rotation, _rgb(color), thickness)
+        with self._lock:
+            entry = self._sprites.get(key)
+            if entry is not None:
+                self._sprites.move_to_end(key)
+                return entry
+
+        sprite, (anchor_x, anchor_y) = self.renderers[kind](key[1], rotation, key[3], thickness)
+        width = max(1, sprite.width // SUPERSAMPLE)
+        height = max(1, sprite.height // SUPERSAMPLE)
+        entry = (sprite.resize((width, height), Image.LANCZOS), (anchor_x // SUPERSAMPLE, anchor_y // SUPERSAMPLE))
+
+        with self._lock:
+            self._sprites[key] = entry
+            while len(self._sprites) > self.max_sprites:
+                self._sprites.popitem(last=False)
+        return entry
+
+    def paste(self, image, kind, xy, size, rotation=0, color=(255, 0, 0), thickness=1.5):
+        """Alpha-paste an element onto image with its anchor at xy"""
+        sprite, (anchor_x, anchor_y) = self.get(kind, size, rotation, color, thickness)
+        image.paste(sprite, (int(xy[0]) - anchor_x, int(xy[1]) - anchor_y), sprite)
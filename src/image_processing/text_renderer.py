@@ -0,0 +1,201 @@
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+
+def _rgb(color):
+    return ImageColor.getrgb(color) if isinstance(color, str) else tuple(color)
+
+
+# Glyph metrics are measured once at this size and scaled linearly to others
+METRICS_SIZE = 100
+
+
+class TextRenderer:
+    """Renders stroked text as cached sprites and lays it out to fit a box
+
+    Fonts are loaded once per (path, size) from the first candidate path that
+    works. Each distinct (text, font, size, colors, stroke) is rasterized once,
+    with the stroke drawn natively in the same pass, and later draws paste the
+    cached sprite. Layout measures text with a per-font table of glyph
+    advances, so fitting a title never rasterizes it.
+    """
+
+    def __init__(self, font_paths, max_sprite_bytes=32 * 1024 * 1024):
+        self.font_paths = list(font_paths)
+        self.max_sprite_bytes = max_sprite_bytes
+        self._font_path = None
+        self._fonts = {}
+        self._sprites = OrderedDict()
+        self._sprite_bytes = 0
+        self._advances = {}
+        self._lock = threading.Lock()
+        # FreeType faces are not safe to rasterize with from several threads at once
+        self._render_lock = threading.Lock()
+
+    def font(self, size):
+        """Return (font, path) for a size; path is None for Pillow's default font"""
+        with self._lock:
+            cached = self._fonts.get((self._font_path, size))
+            if cached is not None:
+                return cached, self._font_path
+
+        # Once a path has worked, only that one is tried for other sizes
+        candidates = [self._font_path] if self._font_path else self.font_paths
+        for path in candidates:
+            try:
+                font = ImageFont.truetype(path, size)
+            except Exception:
+                continue
+            with self._lock:
+                self._font_path = path
+                self._fonts[(path, size)] = font
+            return font, path
+
+        try:
+            font = ImageFont.load_default(size)
+        except TypeError:
+            # Pillow < 10.1 only has the fixed-size bitmap font
+            font = ImageFont.load_default()
+        with self._lock:
+            self._fonts[(None, size)] = font
+        return font, None
+
+    def render(self, text, size, fill, stroke_width=0, stroke_fill=(0, 0, 0)):
+        """Return (sprite, (left, top)): an RGBA sprite and its offset from the text origin"""
+        fill, stroke_fill = _rgb(fill), _rgb(stroke_fill)
+        font, path = self.font(size)
+        if not isinstance(font, ImageFont.FreeTypeFont):
+            # The bitmap fallback font cannot be stroked
+            stroke_width = 0
+        key = (text, path, size, fill, stroke_width, stroke_fill)
+
+        with self._lock:
+            entry = self._sprites.get(key)
+            if entry is not None:
+                self._sprites.move_to_end(key)
+                return entry
+
+        with self._render_lock:
+            entry = self._rasterize(text, font, fill, stroke_width, stroke_fill)
+
+        sprite_bytes = entry[0].width * entry[0].height * 4
+        with self._lock:
+            if key not in self._sprites and sprite_bytes <= self.max_sprite_bytes:
+                self._sprites[key] = entry
+                self._sprite_bytes += sprite_bytes
+                while self._sprite_bytes > self.max_sprite_bytes:
+                    _, (evicted, _) = self._sprites.popitem(last=False)
+                    self._sprite_bytes -= evicted.width * evicted.height * 4
+        return entry
+
+    def advance(self, text, size):
+        """Approximate advance width of text at a size, from the cached glyph advance table"""
+        font, path = self.font(METRICS_SIZE)
+        with self._lock:
+            advances = self._advances.setdefault(path, {})
+            missing = [char for char in set(text) if char not in advances]
+        if missing:
+            with self._render_lock:
+                for char in missing:
+                    advances[char] = self._glyph_advance(font, char)
+        total = sum(advances[char] for char in text)
+        if not isinstance(font, ImageFont.FreeTypeFont):
+            # The bitmap fallback font has a single size
+            return total
+        return total * size / METRICS_SIZE
+
+    def line_height(self, size):
+        font, _ = self.font(METRICS_SIZE)
+        ascent, descent = self._metrics(font)
+        if not isinstance(font, ImageFont.FreeTypeFont):
+            return ascent + descent
+        return (ascent + descent) * size / METRICS_SIZE
+
+    def wrap(self, text, size, max_width):
+        """Greedily break text into lines no wider than max_width (a single long word may exceed it)"""
+        lines = []
+        space = self.advance(' ', size)
+        line, line_width = [], 0.0
+        for word in text.split():
+            word_width = self.advance(word, size)
+            if line and line_width + space + word_width > max_width:
+                lines.append(' '.join(line))
+                line, line_width = [], 0.0
+            line_width += (space if line else 0.0) + word_width
+            line.append(word)
+        if line:
+            lines.append(' '.join(line))
+        return lines
+
+    def fit(self, text, max_width, max_height, max_size, min_size=12, stroke_width=0):
+        """Binary search the largest size whose wrapped lines fit the box
+
+        Returns (size, lines). If even min_size does not fit, the text is
+        wrapped at min_size anyway.
+        """
+        def layout(size):
+            lines = self.wrap(text, size, max_width - 2 * stroke_width)
+            fits = (len(lines) * self.line_height(size) + 2 * stroke_width <= max_height and
+                    all(self.advance(line, size) + 2 * stroke_width <= max_width for line in lines))
+            return fits, lines
+
+        low, high = min_size, max(min_size, max_size)
+        best = None
+        while low <= high:
+            middle = (low + high) // 2
+            fits, lines = layout(middle)
+            if fits:
+                best = (middle, lines)
+                low = middle + 1
+            else:
+                high = middle - 1
+        if best is None:
+            best = (min_size, layout(min_size)[1])
+        return best
+
+    def text_size(self, text, size):
+        """Width and height of the text's bounding box, as ImageDraw.textbbox reports it"""
+        font, _ = self.font(size)
+        left, top, right, bottom = self._bbox(font, text, 0)
+        return right - left, bottom - top
+
+    def draw(self, image, xy, text, size, fill, stroke_width=0, stroke_fill=(0, 0, 0)):
+        """Paste text onto image as if drawn with ImageDraw.text at xy"""
+        sprite, (left, top) = self.render(text, size, fill, stroke_width, stroke_fill)
+        image.paste(sprite, (int(xy[0]) + left, int(xy[1]) + top), sprite)
+
+    def _bbox(self, font, text, stroke_width):
+        try:
+            return font.getbbox(text, stroke_width=stroke_width)
+        except (AttributeError, TypeError):
+            width, height = font.getsize(text)
+            return 0, 0, width, height
+
+    def _metrics(self, font):
+        try:
+            return font.getmetrics()
+        except AttributeError:
+            # The bitmap default font only has getmetrics() from Pillow 10.1
+            _, _, _, bottom = self._bbox(font, 'Ag', 0)
+            return bottom, 0
+
+    def _glyph_advance(self, font, char):
+        try:
+            return font.getlength(char)
+        except AttributeError:
+            return font.getsize(char)[0]
+
+    def _rasterize(self, text, font, fill, stroke_width, stroke_fill):
+        left, top, right, bottom = self._bbox(font, text, stroke_width)
+        # The transparent background carries the outer color, so the
+        # anti-aliased edge keeps a straight (not darkened) color when pasted
+        edge = stroke_fill if stroke_width else fill
+        sprite = Image.new('RGBA', (max(1, right - left), max(1, bottom - top)), tuple(edge[:3]) + (0,))
+        draw = ImageDraw.Draw(sprite)
+        if stroke_width:
+            draw.text((-left, -top), text, font=font, fill=fill,
+                      stroke_width=stroke_width, stroke_fill=stroke_fill)
+        else:
+            draw.text((-left, -top), text, font=font, fill=fill)
+        return sprite, (left, top)
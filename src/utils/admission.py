@@ -0,0 +1,127 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class OverloadedError(Exception):
+    """Raised when a pipeline stage is at capacity and its wait queue is full"""
+
+    def __init__(self, stage, retry_after):
+        super().__init__(f"Server is busy ({stage} is at capacity), retry in {retry_after}s")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class StageLimit:
+    """Caps how many callers run a stage at once, with a bounded queue of waiters
+
+    Callers beyond max_concurrent wait up to timeout seconds for a slot. Once
+    max_waiting callers are already waiting, new ones are rejected straight away.
+    """
+
+    def __init__(self, name, max_concurrent, max_waiting, timeout=10.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._average_seconds = 1.0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def acquire(self):
+        with self._condition:
+            if self.active >= self.max_concurrent:
+                if self.waiting >= self.max_waiting:
+                    self._reject()
+                self.waiting += 1
+                try:
+                    admitted = self._condition.wait_for(lambda: self.active < self.max_concurrent, self.timeout)
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self._reject()
+            self.active += 1
+            self.admitted += 1
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._condition:
+                self.active -= 1
+                # Moving average of the hold time, used to suggest a Retry-After
+                self._average_seconds = 0.8 * self._average_seconds + 0.2 * elapsed
+                self._condition.notify()
+
+    def retry_after(self):
+        """Estimated seconds until the current queue drains (caller holds the lock)"""
+        rounds = (self.waiting + self.active) / self.max_concurrent
+        return max(1, math.ceil(rounds * self._average_seconds))
+
+    def stats(self):
+        with self._condition:
+            return {
+                'active': self.active,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'max_concurrent': self.max_concurrent,
+                'max_waiting': self.max_waiting
+            }
+
+    def reject(self):
+        """Count and raise a rejection for a caller turned away outside acquire() (e.g. by a full batch queue)"""
+        with self._condition:
+            self._reject()
+
+    def _reject(self):
+        self.rejected += 1
+        raise OverloadedError(self.name, self.retry_after())
+
+
+class AdmissionController:
+    """Per-stage concurrency limits for the expensive parts of the pipeline
+
+    Stages without a configured limit are admitted unconditionally.
+    """
+
+    def __init__(self):
+        self._stages = {}
+
+    def configure(self, limits, timeout=10.0):
+        """Set limits from a {stage: (max_concurrent, max_waiting)} mapping"""
+        self._stages = {name: StageLimit(name, max_concurrent, max_waiting, timeout)
+                        for name, (max_concurrent, max_waiting) in limits.items()}
+
+    @contextmanager
+    def admit(self, stage):
+        limit = self._stages.get(stage)
+        if limit is None:
+            yield
+            return
+        with limit.acquire():
+            yield
+
+    def reject(self, stage):
+        """Raise OverloadedError for a stage, counting it against the stage's limit if it has one"""
+        limit = self._stages.get(stage)
+        if limit is None:
+            raise OverloadedError(stage, 1)
+        limit.reject()
+
+    def stats(self):
+        return {name: limit.stats() for name, limit in self._stages.items()}
+
+
+controller = AdmissionController()
+
+
+def admit(stage):
+    """Context manager that holds a slot of a limited pipeline stage"""
+    return controller.admit(stage)
@@ -11,6 +11,12 @@ class ThumbnailDatabase:
         self._local = threading.local()
         # We'll create connections on-demand per thread
         self.create_tables()
+        # SQLite connections must not be shared with forked worker processes
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_connections)
+        
+    def _reset_connections(self):
+        self._local = threading.local()
         
     @property
     def conn(self):
@@ -77,7 +83,7 @@ class ThumbnailDatabase:
         """Get thumbnails with high ratings for model training"""
         cursor = self.conn.cursor()
         cursor.execute('''
-            SELECT t.thumbnail_path, t.properties, t.prompt 
+            SELECT t.thumbnail_path, t.original_image_path, t.properties, t.prompt 
             FROM thumbnails t 
             JOIN feedback f ON t.id = f.thumbnail_id 
             WHERE f.rating >= ? 
@@ -88,15 +94,22 @@ class ThumbnailDatabase:
         
         results = []
         for row in cursor.fetchall():
-            thumbnail_path, properties_json, prompt = row
+            thumbnail_path, original_path, properties_json, prompt = row
             results.append({
                 'thumbnail_path': thumbnail_path,
+                'original_path': original_path,
                 'properties': json.loads(properties_json),
                 'prompt': prompt
             })
         
         return results
     
+    def stored_paths(self):
+        """Return the original and thumbnail web paths of every recorded thumbnail"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT original_image_path, thumbnail_path FROM thumbnails")
+        return cursor.fetchall()
+    
     def close(self):
         """Close the database connection for the current thread"""
         if hasattr(self._local, 'conn'):
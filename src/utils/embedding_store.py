@@ -0,0 +1,168 @@
+import heapq
+import os
+import sqlite3
+import threading
+import numpy as np
+
+
+def pool_features(features):
+    """Global-average-pool a (1, H, W, C) or (H, W, C) feature map into a C-vector"""
+    features = np.asarray(features, dtype=np.float32)
+    return features.reshape(-1, features.shape[-1]).mean(axis=0)
+
+
+class EmbeddingStore:
+    """Image embeddings kept on disk for similarity search, ranking and training
+
+    Vectors are float16 rows in fixed-capacity .npy shards of shard_rows rows
+    each, memory-mapped so they are read and scanned without loading whole
+    shards into RAM. Rows are only ever appended. A SQLite table maps each
+    content hash to its global row number; the row is allocated, written and
+    committed inside one write transaction, so several processes can append
+    to the same store safely.
+    """
+
+    def __init__(self, folder, dim=2048, shard_rows=65536):
+        self.folder = folder
+        self.dim = dim
+        self.shard_rows = shard_rows
+        os.makedirs(folder, exist_ok=True)
+        self.db_path = os.path.join(folder, 'index.db')
+        self._local = threading.local()
+        self._shards = {}
+        self._lock = threading.Lock()
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS embeddings (
+            position INTEGER PRIMARY KEY,
+            hash TEXT UNIQUE NOT NULL
+        )
+        ''')
+        self.conn.commit()
+        # SQLite connections and memory maps must not be shared with forked worker processes
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._local = threading.local()
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self):
+        """Get a thread-local database connection"""
+        if not hasattr(self._local, 'conn'):
+            # Autocommit mode, so write transactions are started explicitly with BEGIN IMMEDIATE
+            self._local.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        return self._local.conn
+
+    def shard_path(self, shard):
+        return os.path.join(self.folder, f'shard_{shard:05d}.npy')
+
+    def _shard(self, shard, create=False):
+        """Return the memory map of a shard, creating the file if asked to"""
+        with self._lock:
+            array = self._shards.get(shard)
+            if array is not None:
+                return array
+            path = self.shard_path(shard)
+            if not os.path.exists(path):
+                if not create:
+                    return None
+                # Write the new shard under a temporary name so readers never map a partial header
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float16,
+                                          shape=(self.shard_rows, self.dim)).flush()
+                os.replace(tmp_path, path)
+            array = np.load(path, mmap_mode='r+')
+            self._shards[shard] = array
+            return array
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+
+    def __contains__(self, content_hash):
+        return self._position(content_hash) is not None
+
+    def _position(self, content_hash):
+        row = self.conn.execute('SELECT position FROM embeddings WHERE hash = ?', (content_hash,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, content_hash):
+        """Return the stored vector (float32) for a content hash, or None"""
+        position = self._position(content_hash)
+        if position is None:
+            return None
+        shard, row = divmod(position, self.shard_rows)
+        array = self._shard(shard)
+        return None if array is None else np.array(array[row], dtype=np.float32)
+
+    def put(self, content_hash, vector):
+        """Append a vector for a content hash; a hash that is already stored keeps its first vector"""
+        vector = np.asarray(vector, dtype=np.float16).reshape(self.dim)
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM embeddings WHERE hash = ?', (content_hash,)).fetchone():
+                conn.execute('ROLLBACK')
+                return False
+            position = conn.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM embeddings').fetchone()[0]
+            shard, row = divmod(position, self.shard_rows)
+            array = self._shard(shard, create=True)
+            array[row] = vector
+            array.flush()
+            conn.execute('INSERT INTO embeddings (position, hash) VALUES (?, ?)', (position, content_hash))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def get_or_compute(self, content_hash, compute):
+        """Return the stored vector for a hash, computing and storing it on first use"""
+        vector = self.get(content_hash)
+        if vector is None:
+            vector = np.asarray(compute(), dtype=np.float32).reshape(self.dim)
+            self.put(content_hash, vector)
+        return vector
+
+    def iter_shards(self):
+        """Yield (hashes, vectors) per shard; vectors is a memory-mapped float16 view, not a copy"""
+        count = self.conn.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM embeddings').fetchone()[0]
+        for shard in range((count + self.shard_rows - 1) // self.shard_rows):
+            start = shard * self.shard_rows
+            rows = self.conn.execute(
+                'SELECT position, hash FROM embeddings WHERE position >= ? AND position < ?',
+                (start, start + self.shard_rows)).fetchall()
+            array = self._shard(shard)
+            if not rows or array is None:
+                continue
+            # Positions are allocated densely, so a shard's rows are a prefix of it
+            hashes = [None] * (max(position for position, _ in rows) - start + 1)
+            for position, content_hash in rows:
+                hashes[position - start] = content_hash
+            yield hashes, array[:len(hashes)]
+
+    def similar(self, vector, k=10, chunk_rows=8192):
+        """Return the k stored (hash, cosine similarity) pairs closest to vector, best first
+
+        Shards are scanned chunk_rows rows at a time, so memory use does not
+        grow with the size of the store.
+        """
+        query = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        query = query / (np.linalg.norm(query) or 1.0)
+        best = []
+        for hashes, vectors in self.iter_shards():
+            for start in range(0, len(hashes), chunk_rows):
+                chunk = np.asarray(vectors[start:start + chunk_rows], dtype=np.float32)
+                norms = np.linalg.norm(chunk, axis=1)
+                scores = chunk @ query / np.where(norms > 0, norms, 1.0)
+                for index in np.argsort(scores)[-k:]:
+                    content_hash = hashes[start + index]
+                    if content_hash is None:
+                        continue
+                    item = (float(scores[index]), content_hash)
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    else:
+                        heapq.heappushpop(best, item)
+        return [(content_hash, score) for score, content_hash in sorted(best, reverse=True)]
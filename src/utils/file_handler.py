@@ -1,6 +1,451 @@
+import hashlib
+import io
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from PIL import Image
+from src.utils.metrics import timed
+
+
 def save_image(image, path):
     image.save(path)
 
 def load_image(path):
     from PIL import Image
-    return Image.open(path)
\ No newline at end of file
+    return Image.open(path)
+
+def decode_image(data):
+    """Decode image bytes (e.g. an upload read from the request) into a PIL image"""
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+def encode_image(image, path):
+    """Encode an image to bytes in the format implied by the path's extension"""
+    ext = os.path.splitext(path)[1].lower()
+    image_format = Image.registered_extensions().get(ext, 'PNG')
+    buffer = io.BytesIO()
+    with timed('encode'):
+        image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+def shard_path(folder, filename):
+    """Return the hashed two-level subdirectory path a file is stored under"""
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    return os.path.join(folder, digest[:2], digest[2:4], filename)
+
+def content_etag(data):
+    """Return a strong ETag value derived from the file content"""
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+class ETagIndex:
+    """Remembers content ETags of files on disk, keyed by path, mtime and size
+
+    This lets conditional requests be answered with 304 without reading or
+    hashing the file again.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, path, stat):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != (stat.st_mtime_ns, stat.st_size):
+                return None
+            self._entries.move_to_end(path)
+            return entry[1]
+
+    def remember(self, path, stat, etag):
+        with self._lock:
+            self._entries[path] = ((stat.st_mtime_ns, stat.st_size), etag)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# Suffix of files written but not yet fsynced and renamed into place
+STAGED_SUFFIX = '.pending'
+
+
+class WriteBehindWriter:
+    """Persists files on a background thread so requests never wait on disk
+
+    Writes are queued in a bounded queue and flushed in batches: every file in
+    a batch is staged next to its destination first, then fsynced, then
+    atomically renamed into place, and each touched directory is fsynced once
+    per batch. Until a file lands on disk its content can still be served
+    through pending().
+
+    Queuing a write never touches the disk. Other processes, such as sibling
+    pre-forked workers, can find a file through published() as soon as the
+    background thread has staged it.
+    """
+
+    def __init__(self, max_queue=256, batch_size=32):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self._start()
+        # Threads do not survive fork(), so pre-forked workers need their own writer
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def write_bytes(self, path, data):
+        """Queue raw bytes to be written to path"""
+        self._submit(path, data)
+
+    def save_image(self, image, path):
+        """Queue an image to be encoded and written to path"""
+        self._submit(path, image)
+
+    def pending(self, path):
+        """Return the encoded content of a not-yet-written file, or None"""
+        with self._lock:
+            payload = self._pending.get(path)
+        if payload is None:
+            return None
+        if isinstance(payload, bytes):
+            return payload
+        return encode_image(payload, path)
+
+    def published(self, path):
+        """Return the content of a file staged by any process, or None
+
+        Falls back to the destination itself, since a staged file may be
+        renamed into place while this looks for it.
+        """
+        directory, name = os.path.split(path)
+        prefix = name + '.'
+        try:
+            staged = [entry.path for entry in os.scandir(directory or '.')
+                      if entry.name.startswith(prefix) and entry.name.endswith(STAGED_SUFFIX)]
+        except OSError:
+            staged = []
+        for candidate in staged + [path]:
+            try:
+                with open(candidate, 'rb') as f:
+                    return f.read()
+            except OSError:
+                continue
+        return None
+
+    def depth(self):
+        """Return the number of writes waiting in the queue"""
+        return self._queue.qsize()
+
+    def flush(self):
+        """Block until every queued write has reached the disk"""
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _submit(self, path, payload):
+        with self._lock:
+            self._pending[path] = payload
+        try:
+            self._queue.put_nowait((path, payload))
+        except queue.Full:
+            # The writer is behind, so fall back to writing on the caller's thread
+            print(f"Write-behind queue full, writing {path} synchronously")
+            self._write_batch([(path, payload)])
+
+    def _stage(self, path, data):
+        """Write data to a uniquely named file next to path and return its name"""
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        # A unique name, since a synchronous fallback write can race the writer thread for the same path
+        fd, staged = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix=STAGED_SUFFIX)
+        try:
+            with open(fd, 'wb') as f:
+                f.write(data)
+        except Exception:
+            os.remove(staged)
+            raise
+        return staged
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    # Put the sentinel back so the loop exits after this batch
+                    self._queue.task_done()
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        written = []
+        for path, payload in batch:
+            try:
+                data = payload if isinstance(payload, bytes) else encode_image(payload, path)
+                staged = self._stage(path, data)
+                written.append((path, payload, staged))
+            except Exception as e:
+                print(f"Failed to write {path}: {e}")
+                self._forget(path, payload)
+
+        # fsync only after every file in the batch has been written
+        directories = set()
+        for path, payload, staged in written:
+            try:
+                with open(staged, 'rb') as f:
+                    os.fsync(f.fileno())
+                os.replace(staged, path)
+                directories.add(os.path.dirname(path) or '.')
+            except OSError as e:
+                print(f"Failed to write {path}: {e}")
+                try:
+                    os.remove(staged)
+                except OSError:
+                    pass
+            finally:
+                self._forget(path, payload)
+
+        for directory in directories:
+            try:
+                fd = os.open(directory, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.fsync(fd)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+    def _forget(self, path, payload):
+        with self._lock:
+            # A newer write to the same path may have replaced this payload
+            if self._pending.get(path) is payload:
+                del self._pending[path]
+
+
+class FileStore:
+    """A folder of files sharded into hashed subdirectories
+
+    Files are addressed by bare filename and live at shard_path(). Files from
+    before sharding are still found at the top level until compact() moves
+    them. compact() also applies retention: files no request has touched for
+    ttl seconds are deleted, then the least recently used ones until the
+    folder fits in max_bytes. Files named in the referenced set are never
+    deleted.
+    """
+
+    def __init__(self, folder, writer, ttl=None, max_bytes=None):
+        self.folder = folder
+        self.writer = writer
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def path(self, filename):
+        return shard_path(self.folder, filename)
+
+    def locate(self, filename):
+        """Return the on-disk path of a stored file, or None if it is not on disk"""
+        for path in (self.path(filename), os.path.join(self.folder, filename)):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def write_bytes(self, filename, data):
+        self.writer.write_bytes(self.path(filename), data)
+
+    def save_image(self, image, filename):
+        self.writer.save_image(image, self.path(filename))
+
+    def pending(self, filename):
+        return self.writer.pending(self.path(filename))
+
+    def published(self, filename):
+        """Return the content of a file another process is still writing, or None"""
+        return self.writer.published(self.path(filename))
+
+    def read(self, filename):
+        """Return the content of a stored file, including one still being written, or None"""
+        data = self.pending(filename)
+        if data is not None:
+            return data
+        path = self.locate(filename)
+        if path is None:
+            return self.published(filename)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def store_content(self, data, ext=''):
+        """Store data under a name derived from its content and return the name
+
+        Identical content is only stored once; storing it again just marks the
+        existing file as recently used.
+        """
+        filename = hashlib.sha256(data).hexdigest()[:32] + ext.lower()
+        if self.pending(filename) is not None:
+            return filename
+        path = self.locate(filename)
+        if path is not None:
+            try:
+                os.utime(path)
+                return filename
+            except OSError:
+                pass
+        self.write_bytes(filename, data)
+        return filename
+
+    def compact(self, referenced=frozenset(), now=None):
+        """Shard legacy files, apply TTL/LRU retention and drop empty shard directories"""
+        now = time.time() if now is None else now
+        stats = {'moved': 0, 'expired': 0, 'evicted': 0, 'files': 0, 'bytes': 0}
+        if not os.path.isdir(self.folder):
+            return stats
+
+        files = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.endswith(('.tmp', STAGED_SUFFIX)):
+                path = self.path(entry.name)
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(entry.path, path)
+                    stats['moved'] += 1
+                except OSError as e:
+                    print(f"Failed to move {entry.path} into its shard: {e}")
+
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                if name.endswith(('.tmp', STAGED_SUFFIX)):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path, name))
+
+        total = sum(size for _, size, _, _ in files)
+        candidates = sorted(item for item in files if item[3] not in referenced)
+        for last_used, size, path, name in candidates:
+            if self.ttl is not None and now - last_used > self.ttl:
+                reason = 'expired'
+            elif self.max_bytes is not None and total > self.max_bytes:
+                reason = 'evicted'
+            else:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            stats[reason] += 1
+
+        stats['files'] = len(files) - stats['expired'] - stats['evicted']
+        stats['bytes'] = total
+        self._remove_empty_directories()
+        return stats
+
+    def _remove_empty_directories(self):
+        for root, dirs, names in os.walk(self.folder, topdown=False):
+            if root != self.folder and not dirs and not names:
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
+
+
+class StorageCompactor:
+    """Runs FileStore.compact() for a set of stores on a background thread
+
+    referenced() is called before each pass and returns a {store: set of
+    filenames} mapping of files that must be kept. A lock file ensures only one
+    process (e.g. one pre-forked worker) compacts at a time.
+    """
+
+    def __init__(self, stores, referenced, interval=3600, lock_path=None):
+        self.stores = list(stores)
+        self.referenced = referenced
+        self.interval = interval
+        self.lock_path = lock_path
+        self.last_run = None
+        self._start()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='storage-compactor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run_once(self):
+        """Compact every store now, unless another process is already doing it"""
+        lock = self._try_lock()
+        if lock is False:
+            return None
+        try:
+            referenced = self.referenced()
+            results = {}
+            for store in self.stores:
+                results[store.folder] = store.compact(referenced.get(store, frozenset()))
+            self.last_run = {'finished_at': time.time(), 'stores': results}
+            return self.last_run
+        finally:
+            if lock is not None:
+                lock.close()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Storage compaction failed: {e}")
+
+    def _try_lock(self):
+        """Return an open, locked file, None if locking is unavailable, or False if held elsewhere"""
+        if self.lock_path is None:
+            return None
+        try:
+            import fcntl
+        except ImportError:
+            return None
+        os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+        lock = open(self.lock_path, 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        return lock
@@ -0,0 +1,307 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class Job:
+    """A unit of work tracked by the JobQueue"""
+
+    def __init__(self, job_id, name, store=None):
+        self.id = job_id
+        self.name = name
+        self.store = store
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = {}
+        self.events = []
+        self._events_changed = threading.Condition()
+        self.emit('queued')
+
+    @property
+    def done(self):
+        return self.status in ('done', 'failed')
+
+    @contextmanager
+    def stage(self, name):
+        """Time a named stage of the job"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+            self.save()
+
+    def emit(self, event, data=None):
+        """Record a progress event and wake up anyone streaming this job's events"""
+        with self._events_changed:
+            if self.store is not None:
+                try:
+                    self.store.add_event(self.id, len(self.events), event, data)
+                except Exception as e:
+                    print(f"Failed to store event {event} of job {self.id}: {e}")
+            self.events.append((event, data))
+            self._events_changed.notify_all()
+
+    def save(self):
+        """Write the job's status and timing to the shared store, if there is one"""
+        if self.store is None:
+            return
+        try:
+            self.store.save(self)
+        except Exception as e:
+            print(f"Failed to store job {self.id}: {e}")
+
+    def wait_for_events(self, cursor, timeout=None):
+        """Return the events after position cursor, waiting up to timeout for new ones"""
+        with self._events_changed:
+            self._events_changed.wait_for(lambda: len(self.events) > cursor, timeout)
+            return self.events[cursor:]
+
+    def timing(self):
+        """Return queue wait, run time and per-stage durations in seconds"""
+        now = time.time()
+        started = self.started_at or now
+        finished = self.finished_at or now
+        return {
+            'queue_wait': started - self.submitted_at,
+            'run_time': finished - started if self.started_at else 0.0,
+            'total': finished - self.submitted_at,
+            'stages': dict(self.stages)
+        }
+
+    def to_dict(self):
+        data = {
+            'job_id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class StoredJob(Job):
+    """A job run by another process, read back from a JobStore
+
+    It answers the same status, result, timing and event questions as the
+    Job it was saved from; waiting for events polls the store.
+    """
+
+    def __init__(self, store, row):
+        (self.id, self.name, self.status, result, self.error, self.submitted_at,
+         self.started_at, self.finished_at, stages) = row
+        self.store = store
+        self.result = json.loads(result) if result is not None else None
+        self.stages = json.loads(stages)
+
+    @property
+    def events(self):
+        return self.store.events(self.id)
+
+    def emit(self, event, data=None):
+        raise RuntimeError("Jobs run by another process are read-only")
+
+    def save(self):
+        raise RuntimeError("Jobs run by another process are read-only")
+
+    def wait_for_events(self, cursor, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            events = self.store.events(self.id, cursor)
+            if events or (deadline is not None and time.monotonic() >= deadline):
+                return events
+            time.sleep(self.store.poll_interval)
+
+
+class JobStore:
+    """Job status and events in SQLite, shared by every worker process
+
+    Pre-forked workers each run their own JobQueue, but a client polling a job
+    or streaming its events can reach any of them. The worker running a job
+    writes it here as it progresses, so the others can answer for it.
+    """
+
+    def __init__(self, db_path, poll_interval=0.25):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._local = threading.local()
+        self.create_tables()
+        # SQLite connections must not be shared with forked worker processes
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_connections)
+
+    def _reset_connections(self):
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        """Get a thread-local database connection"""
+        if not hasattr(self._local, 'conn'):
+            self._local.conn = sqlite3.connect(self.db_path, timeout=10)
+        return self._local.conn
+
+    def create_tables(self):
+        # WAL lets workers read jobs while another one is writing
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            status TEXT,
+            result TEXT,
+            error TEXT,
+            submitted_at REAL,
+            started_at REAL,
+            finished_at REAL,
+            stages TEXT
+        )
+        ''')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS job_events (
+            job_id TEXT,
+            position INTEGER,
+            event TEXT,
+            data TEXT,
+            PRIMARY KEY (job_id, position)
+        )
+        ''')
+        self.conn.commit()
+
+    def save(self, job):
+        result = json.dumps(job.result, default=str) if job.result is not None else None
+        self.conn.execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job.id, job.name, job.status, result, job.error, job.submitted_at,
+             job.started_at, job.finished_at, json.dumps(job.stages))
+        )
+        self.conn.commit()
+
+    def add_event(self, job_id, position, event, data):
+        self.conn.execute("INSERT OR REPLACE INTO job_events VALUES (?, ?, ?, ?)",
+                          (job_id, position, event, json.dumps(data, default=str)))
+        self.conn.commit()
+
+    def load(self, job_id):
+        """Return a read-only StoredJob, or None if no worker has saved this job"""
+        row = self.conn.execute(
+            "SELECT id, name, status, result, error, submitted_at, started_at, finished_at, stages "
+            "FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return StoredJob(self, row) if row else None
+
+    def events(self, job_id, cursor=0):
+        rows = self.conn.execute(
+            "SELECT event, data FROM job_events WHERE job_id = ? AND position >= ? ORDER BY position",
+            (job_id, cursor)
+        ).fetchall()
+        return [(event, json.loads(data)) for event, data in rows]
+
+    def prune(self, cutoff):
+        """Delete jobs finished (or, if their worker died, submitted) before cutoff"""
+        expired = "SELECT id FROM jobs WHERE COALESCE(finished_at, submitted_at) < ?"
+        self.conn.execute(f"DELETE FROM job_events WHERE job_id IN ({expired})", (cutoff,))
+        self.conn.execute("DELETE FROM jobs WHERE COALESCE(finished_at, submitted_at) < ?", (cutoff,))
+        self.conn.commit()
+
+
+class JobQueue:
+    """Runs jobs on a bounded thread pool and keeps their status for polling
+
+    With a JobStore, jobs submitted to other processes' queues can be looked
+    up too.
+    """
+
+    def __init__(self, max_workers=2, max_pending=32, result_ttl=3600, store=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='thumbnail-job')
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, name, fn, *args, **kwargs):
+        """Queue fn(*args, job=job, **kwargs) and return the Job immediately"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Job queue is full ({self.max_pending} pending jobs)")
+            self._pending += 1
+            self._prune()
+            job = Job(str(uuid.uuid4()), name, self.store)
+            self._jobs[job.id] = job
+        job.save()
+
+        try:
+            self._executor.submit(self._run, job, fn, args, kwargs)
+        except RuntimeError:
+            with self._lock:
+                self._pending -= 1
+                del self._jobs[job.id]
+            raise
+        return job
+
+    def get(self, job_id):
+        """Return the job with the given id, or None if unknown or expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.load(job_id)
+        return job
+
+    def depth(self):
+        """Return the number of queued and running jobs"""
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job.status == 'queued')
+            running = sum(1 for job in self._jobs.values() if job.status == 'running')
+        return {'queued': queued, 'running': running}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, fn, args, kwargs):
+        job.started_at = time.time()
+        job.status = 'running'
+        job.save()
+        job.emit('started')
+        try:
+            job.result = fn(*args, job=job, **kwargs)
+            status = 'done'
+        except Exception as e:
+            job.error = str(e)
+            status = 'failed'
+        # Set the finish time first so pruning never sees a done job without one
+        job.finished_at = time.time()
+        job.status = status
+        job.save()
+        job.emit(status, job.result if status == 'done' else {'error': job.error})
+        with self._lock:
+            self._pending -= 1
+
+    def _prune(self):
+        """Drop finished jobs older than the result TTL (caller holds the lock)"""
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.done and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if self.store is not None:
+            self.store.prune(cutoff)
@@ -0,0 +1,145 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from src.utils.admission import controller as admission
+
+
+class MicroBatcher:
+    """Groups single-item calls from concurrent threads into batched calls
+
+    submit(item) blocks its caller until the item's result is ready. Each of
+    workers background threads takes the first waiting item, keeps collecting
+    more for up to max_delay seconds or until max_batch_size items are
+    waiting, then calls run_batch(items) once and hands each caller its own
+    result. run_batch must return one result per item, in order; if it
+    raises, every caller in the batch gets the exception.
+
+    With a stage, the batcher applies that admission stage's backpressure: a
+    caller gets OverloadedError (a 429) when max_pending items are already
+    queued, or when its item is still queued after timeout seconds.
+    run_batch itself should hold the stage's slot around the model call, so
+    one slot covers a whole batch.
+
+    With max_batch_size 1 or max_delay 0 items run on the caller's thread.
+    close() stops the background threads once the submitted items have run.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_delay=0.005, name='micro-batcher',
+                 workers=1, max_pending=None, timeout=None, stage=None, controller=None):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.stage = stage
+        self.controller = controller if controller is not None else admission
+        self._closed = False
+        self._start()
+        # Threads do not survive fork(), so pre-forked workers need their own batcher threads
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart)
+
+    @property
+    def inline(self):
+        return self.max_batch_size <= 1 or self.max_delay <= 0
+
+    def _start(self):
+        self._queue = queue.Queue(maxsize=self.max_pending or 0)
+        self._threads = []
+        if self.inline:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'{self.name}-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _restart(self):
+        if not self._closed:
+            self._start()
+
+    def close(self):
+        """Stop the batching threads after the items already submitted have run"""
+        if self._closed:
+            return
+        self._closed = True
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def depth(self):
+        """Return the number of items waiting for a batch"""
+        return self._queue.qsize()
+
+    def submit(self, item):
+        """Return run_batch's result for item, batched with whatever else arrives meanwhile"""
+        if self._closed:
+            raise RuntimeError(f'{self.name} is closed')
+        if self.inline:
+            return self._call([item])[0]
+
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            self._reject()
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            # Still queued: give up on it. Already running: the result is discarded.
+            future.cancel()
+            self._reject()
+
+    def _reject(self):
+        self.controller.reject(self.stage or self.name)
+
+    def _call(self, items):
+        results = list(self.run_batch(items))
+        if len(results) != len(items):
+            raise ValueError(f'{self.name}: run_batch returned {len(results)} results for {len(items)} items')
+        return results
+
+    def _next(self, timeout=None):
+        """Return the next live (item, future) entry, None for the stop sentinel, or raise queue.Empty"""
+        while True:
+            if timeout is None:
+                entry = self._queue.get()
+            elif timeout > 0:
+                entry = self._queue.get(timeout=timeout)
+            else:
+                entry = self._queue.get_nowait()
+            # Skip items whose callers timed out while they were queued
+            if entry is None or entry[1].set_running_or_notify_cancel():
+                return entry
+
+    def _run(self):
+        while True:
+            entry = self._next()
+            if entry is None:
+                return
+            batch = [entry]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                try:
+                    entry = self._next(deadline - time.monotonic())
+                except queue.Empty:
+                    break
+                if entry is None:
+                    # Put the sentinel back so the loop exits after this batch
+                    self._queue.put(None)
+                    break
+                batch.append(entry)
+
+            items = [item for item, _ in batch]
+            try:
+                results = self._call(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+
+class _Flight:
+    """An in-progress computation that concurrent callers can wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResultCache:
+    """Two-tier (memory + disk) LRU cache for generated thumbnails
+
+    Entries are keyed by a content hash of the source image plus the settings
+    that affect the output. Concurrent requests for the same key are coalesced
+    so the pipeline only runs once.
+    """
+
+    def __init__(self, cache_dir, max_memory_bytes=256 * 1024 * 1024, max_disk_bytes=2 * 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (image, size in bytes)
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # key -> file size, least recently used first
+        self._disk_bytes = 0
+        self._inflight = {}
+        self.counters = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0,
+                         'misses': 0, 'coalesced': 0, 'evictions': 0}
+        self._scan_disk()
+
+    @staticmethod
+    def make_key(image_bytes, prompt_properties=None, filter_type=None, template_name=None, template_version=None):
+        """Build a cache key from the image content and normalized generation settings
+
+        template_version (e.g. the template's content hash) keeps renders of an
+        edited template from being served.
+        """
+        properties = {}
+        for name, value in (prompt_properties or {}).items():
+            # Reasoning strings are explanations only and never change the output
+            if name.endswith('_reasoning') or name == 'design_approach':
+                continue
+            properties[name] = value
+
+        settings = json.dumps({
+            'properties': properties,
+            'filter': filter_type,
+            'template': template_name,
+            'template_version': template_version
+        }, sort_keys=True, default=str)
+
+        digest = hashlib.sha256(image_bytes)
+        digest.update(b'\0')
+        digest.update(settings.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return a copy of the cached image for key, or None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.counters['hits'] += 1
+                self.counters['memory_hits'] += 1
+                return entry[0].copy()
+            on_disk = key in self._disk
+
+        if on_disk:
+            image = self._read_disk(key)
+            if image is not None:
+                with self._lock:
+                    self.counters['hits'] += 1
+                    self.counters['disk_hits'] += 1
+                    self._remember(key, image)
+                return image.copy()
+
+        with self._lock:
+            self.counters['misses'] += 1
+        return None
+
+    def put(self, key, image):
+        """Store an image in both cache tiers"""
+        image = image.copy()
+        with self._lock:
+            self._remember(key, image)
+        self._write_disk(key, image)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached image for key, running compute() once on a miss
+
+        Callers that arrive while another thread is computing the same key wait
+        for that result instead of starting their own computation.
+        """
+        image = self.get(key)
+        if image is not None:
+            return image
+
+        with self._lock:
+            # Another leader may have finished between the lookup and taking the lock
+            entry = self._memory.get(key)
+            if entry is not None:
+                return entry[0].copy()
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+            else:
+                self.counters['coalesced'] += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result.copy()
+
+        try:
+            flight.result = compute()
+            self.put(key, flight.result)
+            return flight.result.copy()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.event.set()
+
+    def stats(self):
+        """Return hit/miss counters and tier sizes"""
+        with self._lock:
+            stats = dict(self.counters)
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+            stats['memory_entries'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_bytes
+            stats['disk_entries'] = len(self._disk)
+            stats['disk_bytes'] = self._disk_bytes
+        return stats
+
+    def _remember(self, key, image):
+        """Insert into the memory tier and evict LRU entries (caller holds the lock)"""
+        size = image.width * image.height * len(image.getbands())
+        if size > self.max_memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        self._memory[key] = (image, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self.counters['evictions'] += 1
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.png')
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with Image.open(path) as cached:
+                image = cached.copy()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._forget_disk(key)
+            return None
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        return image
+
+    def _write_disk(self, key, image):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            image.save(tmp_path, format='PNG')
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"Failed to write cache entry {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            self._forget_disk(key)
+            self._disk[key] = size
+            self._disk_bytes += size
+            evicted = []
+            while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+                old_key, old_size = self._disk.popitem(last=False)
+                self._disk_bytes -= old_size
+                self.counters['evictions'] += 1
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def _forget_disk(self, key):
+        """Drop a disk index entry (caller holds the lock)"""
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def _scan_disk(self):
+        """Rebuild the disk index from files left by previous runs, oldest first"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.png'):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
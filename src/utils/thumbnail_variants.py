@@ -0,0 +1,68 @@
+import os
+from src.image_processing.resize import resize_variants
+from src.utils.file_handler import decode_image, encode_image
+from src.utils.metrics import timed
+
+
+class ThumbnailVariants:
+    """Smaller pre-rendered copies of generated thumbnails
+
+    Variants are rendered from the in-memory result when a thumbnail is saved,
+    and rendered on demand (then persisted) for thumbnails that predate them.
+    With an OutputEncoder, variants saved with a thumbnail reuse the quality
+    chosen for it, and ones rendered on demand get their own quality search;
+    otherwise they are encoded with the format's defaults.
+    """
+
+    def __init__(self, store, sizes, encoder=None):
+        self.store = store
+        self.sizes = dict(sizes)
+        self.encoder = encoder
+        self._by_dimensions = {f'{w}x{h}': name for name, (w, h) in self.sizes.items()}
+
+    def resolve(self, size):
+        """Map a variant name or 'WIDTHxHEIGHT' string to a variant name"""
+        if size in self.sizes:
+            return size
+        return self._by_dimensions.get(size)
+
+    def variant_filename(self, filename, name):
+        stem, ext = os.path.splitext(filename)
+        return f'{stem}__{name}{ext}'
+
+    def variant_filenames(self, filename):
+        return [self.variant_filename(filename, name) for name in self.sizes]
+
+    def save(self, image, filename, encoding=None):
+        """Queue every variant of a freshly generated thumbnail for writing
+
+        encoding is the parameters the thumbnail itself was encoded with.
+        """
+        for name, variant in resize_variants(image, self.sizes).items():
+            variant_filename = self.variant_filename(filename, name)
+            self.store.write_bytes(variant_filename, self._encode(variant, variant_filename, encoding))
+
+    def read(self, filename, name):
+        """Return the encoded bytes of a variant, rendering it if needed, or None"""
+        variant_filename = self.variant_filename(filename, name)
+        data = self.store.read(variant_filename)
+        if data is not None:
+            return data
+
+        original = self.store.read(filename)
+        if original is None:
+            return None
+
+        variant = resize_variants(decode_image(original), {name: self.sizes[name]})[name]
+        data = self._encode(variant, variant_filename)
+        self.store.write_bytes(variant_filename, data)
+        return data
+
+    def _encode(self, image, filename, encoding=None):
+        # Thumbnails saved before the output format changed keep their own format
+        if self.encoder is None or os.path.splitext(filename)[1].lower() != self.encoder.extension:
+            return encode_image(image, filename)
+        with timed('encode'):
+            if encoding is not None:
+                return self.encoder.encode_like(image, encoding)
+            return self.encoder.encode(image)[0]
@@ -0,0 +1,59 @@
+import threading
+import unittest
+from src.utils.admission import AdmissionController, OverloadedError
+
+
+class TestAdmission(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = AdmissionController()
+        self.controller.configure({'inference': (1, 1)}, timeout=5)
+
+    def test_unlimited_stage_is_admitted(self):
+        with self.controller.admit('unknown'):
+            pass
+        self.assertNotIn('unknown', self.controller.stats())
+
+    def test_rejects_when_wait_queue_is_full(self):
+        release = threading.Event()
+        entered = threading.Event()
+
+        def hold():
+            with self.controller.admit('inference'):
+                entered.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        entered.wait(5)
+        def wait():
+            with self.controller.admit('inference'):
+                pass
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        while self.controller.stats()['inference']['waiting'] == 0:
+            pass
+
+        with self.assertRaises(OverloadedError) as context:
+            with self.controller.admit('inference'):
+                pass
+        self.assertGreaterEqual(context.exception.retry_after, 1)
+
+        release.set()
+        holder.join()
+        waiter.join()
+        stats = self.controller.stats()['inference']
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['admitted'], 2)
+
+    def test_wait_timeout_rejects(self):
+        self.controller.configure({'analysis': (1, 4)}, timeout=0.05)
+        with self.controller.admit('analysis'):
+            with self.assertRaises(OverloadedError):
+                with self.controller.admit('analysis'):
+                    pass
+        self.assertEqual(self.controller.stats()['analysis']['waiting'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,15 @@
+import io
+import shutil
+import tempfile
 import unittest
 from src.ai.model import ThumbnailModel
 from src.ai.generator import ThumbnailGenerator
+from src.ai.backbones import Backbone
+from src.ai.content_analyzer import ContentAnalyzer, guided_upsample
+from src.utils.embedding_store import EmbeddingStore
+from src.utils.file_handler import decode_image
 from PIL import Image
+import numpy as np
 
 class TestThumbnailGenerator(unittest.TestCase):
 
@@ -20,5 +28,93 @@ class TestThumbnailGenerator(unittest.TestCase):
         self.assertIsNotNone(thumbnail)
         self.assertEqual(thumbnail.size, (1280, 720))
 
+    def test_generate_variants(self):
+        variants = self.generator.generate_variants(self.test_image, [
+            {'text_overlay': 'TOP', 'raw_prompt': '', 'positions': {'text': 'top'}},
+            {'text_overlay': 'BOTTOM', 'raw_prompt': '', 'positions': {'text': 'bottom'}, 'text_color': '#FFFF00'}
+        ])
+        self.assertEqual(len(variants), 2)
+        self.assertEqual([variant.size for variant in variants], [(1280, 720)] * 2)
+        self.assertNotEqual(variants[0].tobytes(), variants[1].tobytes())
+
+    def test_iter_batch_reports_failed_images_and_continues(self):
+        error = ValueError('Could not decode image')
+        results = {index: (thumbnail, failure) for index, thumbnail, failure
+                   in self.generator.iter_batch([self.test_image, error, self.test_image])}
+        self.assertEqual(sorted(results), [0, 1, 2])
+        self.assertIs(results[1][1], error)
+        self.assertEqual(results[0][0].size, (1280, 720))
+        self.assertIsNone(results[2][1])
+
+    def test_analysis_context_is_lazy_and_memoized(self):
+        analyzer = self.generator.content_analyzer
+        calls = []
+        detect_faces = analyzer.detect_faces
+        analyzer.detect_faces = lambda img: calls.append(img.shape) or detect_faces(img)
+        context = analyzer.context(self.test_image)
+        self.assertEqual(len(context.faces), len(context.faces))
+        self.assertEqual(calls, [(360, 640)])
+        self.assertNotIn('features', context._values)
+
+    def test_guided_upsample_follows_full_resolution_edges(self):
+        # A bright square whose edge falls between proxy pixels
+        guide = np.zeros((64, 64), np.uint8)
+        guide[:, 30:] = 255
+        small = np.array(Image.fromarray(guide).resize((16, 16), Image.BILINEAR))
+        mask = (small > 127).astype(np.uint8)
+        alpha = guided_upsample(mask, small, guide, radius=2)
+        self.assertEqual(alpha.shape, (64, 64))
+        self.assertLess(alpha[32, 26], 0.25)
+        self.assertGreater(alpha[32, 32], 0.75)
+
+class TestEmbeddingReuse(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.batches = []
+
+        def build():
+            def model(batch, training=False):
+                self.batches.append(len(batch))
+                return batch.reshape(len(batch), -1, 3).mean(axis=1)
+            return model
+
+        backbone = Backbone('counting', build, input_size=8, dim=3)
+        self.analyzer = ContentAnalyzer(EmbeddingStore(self.directory, dim=3), backbone)
+
+    def tearDown(self):
+        self.analyzer.close()
+        shutil.rmtree(self.directory)
+
+    def test_second_request_for_same_bytes_skips_backbone(self):
+        buffered = io.BytesIO()
+        Image.new('RGB', (64, 36), color=(200, 40, 40)).save(buffered, format='PNG')
+        image_bytes = buffered.getvalue()
+
+        first = self.analyzer.analyze(decode_image(image_bytes), 'upload-hash')['embedding']
+        second = self.analyzer.analyze(decode_image(image_bytes), 'upload-hash')['embedding']
+        self.assertEqual(self.batches, [1])
+        np.testing.assert_allclose(first, second, rtol=1e-3)
+
+    def test_images_without_content_hash_are_not_stored(self):
+        image = Image.new('RGB', (64, 36), color=(200, 40, 40))
+        self.analyzer.embedding(image)
+        self.analyzer.embedding(image)
+        self.assertEqual(self.batches, [1, 1])
+        self.assertEqual(len(self.analyzer.embedding_store), 0)
+
+class TestThumbnailModelBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.model = ThumbnailModel()
+        self.model.load_model()
+
+    def test_predict_batch(self):
+        images = [Image.new('RGB', (64, 36), color=color) for color in ('red', 'green', 'blue')]
+        images.append(Image.new('RGB', (32, 18), color='white'))
+        enhanced = self.model.predict_batch(images)
+        self.assertEqual(len(enhanced), 4)
+        self.assertEqual([image.size for image in enhanced], [image.size for image in images])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,36 @@
+import unittest
+import numpy as np
+from src.ai.backbones import BACKBONES, Backbone, get_backbone, register_backbone
+
+
+class TestBackbones(unittest.TestCase):
+
+    def tearDown(self):
+        BACKBONES.pop('test', None)
+
+    def test_backbone_loads_on_first_use(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            return lambda batch, training=False: batch.reshape(len(batch), -1, 3).mean(axis=1)
+
+        register_backbone('test', lambda: Backbone('test', build, lambda batch: batch / 255.0, input_size=4, dim=3))
+        backbone = get_backbone('test')
+        self.assertIs(get_backbone('test'), backbone)
+        self.assertFalse(backbone.loaded)
+        self.assertEqual(builds, [])
+
+        features = backbone(np.full((2, 4, 4, 3), 255))
+        self.assertEqual(features.shape, (2, 3))
+        np.testing.assert_allclose(features, 1.0)
+        backbone(np.zeros((1, 4, 4, 3)))
+        self.assertEqual(builds, [1])
+
+    def test_none_and_unknown_backbones(self):
+        self.assertIsNone(get_backbone('none'))
+        with self.assertRaises(ValueError):
+            get_backbone('no-such-backbone')
+
+if __name__ == '__main__':
+    unittest.main()
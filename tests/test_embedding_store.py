@@ -0,0 +1,51 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from src.utils.embedding_store import EmbeddingStore, pool_features
+
+
+class TestEmbeddingStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = EmbeddingStore(self.directory, dim=4, shard_rows=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_put_and_get_across_shards(self):
+        vectors = {f'hash{i}': np.array([i, 1, 0, 0], dtype=np.float32) for i in range(5)}
+        for content_hash, vector in vectors.items():
+            self.assertTrue(self.store.put(content_hash, vector))
+        self.assertFalse(self.store.put('hash0', np.ones(4)))
+
+        self.assertEqual(len(self.store), 5)
+        np.testing.assert_array_equal(self.store.get('hash3'), vectors['hash3'])
+        np.testing.assert_array_equal(self.store.get('hash0'), vectors['hash0'])
+        self.assertIsNone(self.store.get('missing'))
+
+        reopened = EmbeddingStore(self.directory, dim=4, shard_rows=2)
+        scanned = [content_hash for hashes, _ in reopened.iter_shards() for content_hash in hashes]
+        self.assertEqual(scanned, list(vectors))
+
+    def test_get_or_compute_runs_once(self):
+        calls = []
+        compute = lambda: calls.append(1) or np.array([0, 0, 1, 0])
+        self.store.get_or_compute('image', compute)
+        self.store.get_or_compute('image', compute)
+        self.assertEqual(len(calls), 1)
+
+    def test_similar(self):
+        self.store.put('x', [1, 0, 0, 0])
+        self.store.put('y', [0, 1, 0, 0])
+        self.store.put('xy', [1, 1, 0, 0])
+        results = self.store.similar([1, 0.1, 0, 0], k=2)
+        self.assertEqual([content_hash for content_hash, _ in results], ['x', 'xy'])
+
+    def test_pool_features(self):
+        features = np.arange(2 * 2 * 3, dtype=np.float32).reshape(1, 2, 2, 3)
+        np.testing.assert_allclose(pool_features(features), [4.5, 5.5, 6.5])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from PIL import Image
+from src.utils.file_handler import decode_image, shard_path, FileStore, WriteBehindWriter
+
+
+class TestFileHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.writer = WriteBehindWriter(max_queue=4, batch_size=2)
+
+    def tearDown(self):
+        self.writer.close()
+        shutil.rmtree(self.directory)
+
+    def test_decode_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (20, 10), color='blue').save(buffer, format='PNG')
+        image = decode_image(buffer.getvalue())
+        self.assertEqual(image.size, (20, 10))
+
+    def test_write_behind_persists_files(self):
+        paths = [os.path.join(self.directory, f'upload_{i}.bin') for i in range(10)]
+        for i, path in enumerate(paths):
+            self.writer.write_bytes(path, bytes([i]) * 16)
+        image_path = os.path.join(self.directory, 'thumb.png')
+        self.writer.save_image(Image.new('RGB', (8, 8)), image_path)
+        self.writer.flush()
+
+        for i, path in enumerate(paths):
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), bytes([i]) * 16)
+        self.assertEqual(Image.open(image_path).size, (8, 8))
+        self.assertIsNone(self.writer.pending(image_path))
+
+    def test_full_queue_writes_leave_no_temp_files(self):
+        path = os.path.join(self.directory, 'same.bin')
+        payloads = [bytes([i]) * 1024 for i in range(20)]
+        for data in payloads:
+            self.writer.write_bytes(path, data)
+        self.writer.flush()
+
+        with open(path, 'rb') as f:
+            self.assertIn(f.read(), payloads)
+        self.assertEqual(os.listdir(self.directory), ['same.bin'])
+
+    def test_staged_bytes_are_visible_to_other_writers(self):
+        path = os.path.join(self.directory, 'shared.bin')
+        other_process = WriteBehindWriter()
+        try:
+            staged = self.writer._stage(path, b'staged elsewhere')
+            self.assertEqual(other_process.published(path), b'staged elsewhere')
+            self.assertIsNone(other_process.pending(path))
+            os.remove(staged)
+
+            self.writer.write_bytes(path, b'queued elsewhere')
+            self.writer.flush()
+            self.assertEqual(other_process.published(path), b'queued elsewhere')
+        finally:
+            other_process.close()
+
+    def test_store_content_deduplicates(self):
+        store = FileStore(self.directory, self.writer)
+        first = store.store_content(b'same image', '.PNG')
+        second = store.store_content(b'same image', '.png')
+        self.writer.flush()
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith('.png'))
+        self.assertEqual(store.locate(first), shard_path(self.directory, first))
+        self.assertEqual(store.read(first), b'same image')
+
+    def test_compact_shards_legacy_files_and_applies_retention(self):
+        store = FileStore(self.directory, self.writer, ttl=60, max_bytes=24)
+        now = time.time()
+        for name, age in (('legacy.jpg', 0), ('kept.jpg', 600), ('old.jpg', 600),
+                          ('lru_old.jpg', 30), ('lru_new.jpg', 10)):
+            path = os.path.join(self.directory, name)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 8)
+            os.utime(path, (now - age, now - age))
+
+        stats = store.compact(referenced={'kept.jpg'}, now=now)
+
+        self.assertEqual(stats['moved'], 5)
+        self.assertEqual(stats['expired'], 1)
+        self.assertEqual(stats['evicted'], 1)
+        self.assertIsNone(store.locate('old.jpg'))
+        self.assertIsNone(store.locate('lru_old.jpg'))
+        self.assertEqual(store.locate('kept.jpg'), shard_path(self.directory, 'kept.jpg'))
+        self.assertIsNotNone(store.locate('lru_new.jpg'))
+        self.assertFalse(any(entry.is_file() for entry in os.scandir(self.directory)))
+
+
+if __name__ == '__main__':
+    unittest.main()
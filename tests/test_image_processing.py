@@ -1,7 +1,13 @@
+import io
+import time
 import unittest
-from src.image_processing.resize import resize_image
+from src.image_processing.resize import resize_image, resize_variants, contact_sheet
 from src.image_processing.filters import apply_filter
-from PIL import Image
+from src.image_processing.encoder import OutputEncoder
+from src.image_processing.compositing import composite, solid, vertical_gradient
+from src.image_processing.text_renderer import TextRenderer
+from src.image_processing.sprites import SpriteAtlas
+from PIL import Image, ImageChops
 
 class TestImageProcessing(unittest.TestCase):
 
@@ -12,9 +18,128 @@ class TestImageProcessing(unittest.TestCase):
         resized_image = resize_image(self.image, (50, 50))
         self.assertEqual(resized_image.size, (50, 50))
 
+    def test_resize_variants(self):
+        variants = resize_variants(self.image, {'small': (20, 20), 'medium': (50, 50)})
+        self.assertEqual(variants['medium'].size, (50, 50))
+        self.assertEqual(variants['small'].size, (20, 20))
+
+    def test_contact_sheet(self):
+        sheet = contact_sheet([self.image] * 5, (40, 20), columns=4, padding=2)
+        self.assertEqual(sheet.size, (4 * 42 + 2, 2 * 22 + 2))
+        self.assertEqual(sheet.getpixel((3, 3)), (255, 0, 0))
+
     def test_apply_filter(self):
         filtered_image = apply_filter(self.image, 'BLUR')
         self.assertIsNotNone(filtered_image)
 
+    def test_output_encoder_fits_byte_budget(self):
+        noise = Image.effect_noise((200, 200), 16).convert('RGB')
+        data, parameters = OutputEncoder('JPEG', max_bytes=8000).encode(noise)
+        self.assertLessEqual(len(data), 8000)
+        self.assertLess(parameters['quality'], 95)
+        self.assertEqual(parameters['bytes'], len(data))
+        self.assertNotIn('size', parameters)
+        self.assertEqual(Image.open(io.BytesIO(data)).format, 'JPEG')
+
+    def test_output_encoder_downscales_when_budget_is_too_small(self):
+        noise = Image.effect_noise((200, 200), 64).convert('RGB')
+        data, parameters = OutputEncoder('JPEG', max_bytes=8000).encode(noise)
+        self.assertLessEqual(len(data), 8000)
+        self.assertEqual(parameters['quality'], 40)
+        self.assertEqual(Image.open(io.BytesIO(data)).size, tuple(parameters['size']))
+        self.assertLess(parameters['size'][0], 200)
+
+    def test_output_encoder_reuses_chosen_quality(self):
+        encoder = OutputEncoder('JPEG', min_psnr=35.0)
+        noise = Image.effect_noise((200, 200), 16).convert('RGB')
+        data, parameters = encoder.encode(noise)
+        self.assertEqual(encoder.encode_like(noise, parameters), data)
+        small = encoder.encode_like(noise.resize((50, 50)), parameters)
+        self.assertEqual(Image.open(io.BytesIO(small)).size, (50, 50))
+
+    def test_output_encoder_quality_target(self):
+        data, parameters = OutputEncoder('WEBP', min_psnr=30.0).encode(self.image)
+        self.assertGreaterEqual(parameters.get('psnr', float('inf')), 30.0)
+        self.assertGreaterEqual(parameters['quality'], 40)
+
+    def test_output_encoder_palette_png(self):
+        data, parameters = OutputEncoder('png').encode(self.image)
+        self.assertEqual(parameters['colors'], 256)
+        self.assertEqual(Image.open(io.BytesIO(data)).mode, 'P')
+
+    def test_composite_matches_alpha_composite(self):
+        overlay = Image.new('RGBA', (100, 100), (0, 0, 255, 128))
+        expected = Image.alpha_composite(self.image.convert('RGBA'), overlay).convert('RGB')
+        result = composite([self.image, solid((0, 0, 255, 128), (100, 100))], (100, 100))
+        self.assertEqual(result.mode, 'RGB')
+        for channel, value in zip(result.getpixel((5, 5)), expected.getpixel((5, 5))):
+            self.assertAlmostEqual(channel, value, delta=1)
+
+    def test_composite_gradient_keeps_translucency(self):
+        gradient = vertical_gradient((100, 100), (20, 20, 20, 255), (20, 20, 20, 0))
+        result = composite([gradient], (100, 100), 'RGBA')
+        self.assertEqual(result.getpixel((0, 0)), (20, 20, 20, 255))
+        self.assertEqual(result.getpixel((0, 99))[3], 0)
+
+    def test_composite_is_no_slower_than_alpha_composite(self):
+        size = (1280, 720)
+        image = Image.effect_noise(size, 32).convert('RGB')
+        overlay = composite([solid((0, 0, 0, 76), size), solid((255, 0, 0, 20), size)], size, 'RGBA')
+
+        def best_of(render, runs=5):
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                render()
+                timings.append(time.perf_counter() - start)
+            return min(timings)
+
+        # The per-render cost before the compositing pass: convert, blend the overlay, convert back
+        baseline = best_of(lambda: Image.alpha_composite(image.convert('RGBA'), overlay).convert('RGB'))
+        blended = best_of(lambda: composite([image, overlay], size))
+        self.assertLessEqual(blended, baseline * 1.5 + 0.002)
+
+    def test_text_renderer_reuses_sprites(self):
+        renderer = TextRenderer(['missing-font.ttf'])
+        canvas = Image.new('RGB', (200, 50), color='blue')
+        renderer.draw(canvas, (10, 10), 'Hello', 20, '#FFFFFF', 2, (0, 0, 0))
+        self.assertIsNotNone(ImageChops.difference(canvas, Image.new('RGB', (200, 50), color='blue')).getbbox())
+
+        sprite, _ = renderer.render('Hello', 20, (255, 255, 255), 2, (0, 0, 0))
+        self.assertIs(renderer.render('Hello', 20, '#FFFFFF', 2, '#000000')[0], sprite)
+        self.assertIsNot(renderer.render('Hello', 20, (255, 0, 0), 2, (0, 0, 0))[0], sprite)
+
+    def test_text_renderer_fits_text(self):
+        renderer = TextRenderer(['missing-font.ttf'])
+        title = 'A much longer title that cannot possibly fit on one line'
+        size, lines = renderer.fit(title, 300, 2 * renderer.line_height(80), 80, min_size=8)
+        self.assertGreater(len(lines), 1)
+        self.assertEqual(' '.join(lines), title)
+        for line in lines:
+            self.assertLessEqual(renderer.advance(line, size), 300)
+        self.assertLessEqual(len(lines) * renderer.line_height(size), 2 * renderer.line_height(80))
+
+    def test_text_renderer_metrics_without_getmetrics(self):
+        class BitmapFont:
+            # Pillow < 10.1 bitmap fonts only offer getsize()
+            def getsize(self, text):
+                return 6 * len(text), 11
+
+        self.assertEqual(TextRenderer(['missing-font.ttf'])._metrics(BitmapFont()), (11, 0))
+
+    def test_sprite_atlas_buckets_rotations(self):
+        atlas = SpriteAtlas(rotation_step=5)
+        sprite, anchor = atlas.get('arrow', 40, 44, '#FF0000')
+        self.assertIs(atlas.get('arrow', 40, 46, (255, 0, 0))[0], sprite)
+        self.assertIsNot(atlas.get('arrow', 40, 50, (255, 0, 0))[0], sprite)
+        self.assertEqual(sprite.mode, 'RGBA')
+
+        canvas = Image.new('RGB', (100, 100), color='blue')
+        atlas.paste(canvas, 'circle', (50, 50), 60, color=(255, 220, 0), thickness=4)
+        self.assertEqual(canvas.getpixel((50, 50)), (0, 0, 255))
+        # Supersampled edges are resampled with LANCZOS, which rings slightly even inside the stroke
+        for channel, value in zip(canvas.getpixel((50, 21)), (255, 220, 0)):
+            self.assertAlmostEqual(channel, value, delta=8)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
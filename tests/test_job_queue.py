@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from src.utils.job_queue import JobQueue, JobStore, QueueFullError, StoredJob
+
+
+def wait_for(job, timeout=5):
+    deadline = time.time() + timeout
+    while not job.done and time.time() < deadline:
+        time.sleep(0.01)
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = JobQueue(max_workers=1, max_pending=2)
+
+    def tearDown(self):
+        self.queue.shutdown()
+
+    def test_job_result_and_timing(self):
+        def work(value, job=None):
+            with job.stage('double'):
+                return value * 2
+
+        job = self.queue.submit('double', work, 21)
+        wait_for(job)
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.result, 42)
+        self.assertIn('double', job.timing()['stages'])
+        self.assertIs(self.queue.get(job.id), job)
+
+    def test_failed_job_records_error(self):
+        def work(job=None):
+            raise ValueError("boom")
+
+        job = self.queue.submit('fail', work)
+        wait_for(job)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'boom')
+
+    def test_job_events(self):
+        def work(job=None):
+            job.emit('stage', {'stage': 'halfway'})
+            return 'ok'
+
+        job = self.queue.submit('events', work)
+        wait_for(job)
+        events = job.wait_for_events(0, timeout=1)
+        self.assertEqual([event for event, _ in events], ['queued', 'started', 'stage', 'done'])
+        self.assertEqual(events[-1][1], 'ok')
+        self.assertEqual(job.wait_for_events(len(events), timeout=0.01), [])
+
+    def test_queue_rejects_when_full(self):
+        release = threading.Event()
+
+        def work(job=None):
+            release.wait(5)
+
+        jobs = [self.queue.submit('block', work) for _ in range(2)]
+        with self.assertRaises(QueueFullError):
+            self.queue.submit('block', work)
+        release.set()
+        for job in jobs:
+            wait_for(job)
+        self.assertEqual(self.queue.depth(), {'queued': 0, 'running': 0})
+
+
+class TestJobStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = JobStore(os.path.join(self.directory, 'jobs.db'), poll_interval=0.01)
+        self.queue = JobQueue(max_workers=1, store=self.store)
+        # A queue in another worker process sharing the same database
+        self.other_queue = JobQueue(max_workers=1, store=JobStore(self.store.db_path, poll_interval=0.01))
+
+    def tearDown(self):
+        self.queue.shutdown()
+        self.other_queue.shutdown()
+        shutil.rmtree(self.directory)
+
+    def test_other_queue_answers_for_job(self):
+        release = threading.Event()
+
+        def work(job=None):
+            with job.stage('render'):
+                job.emit('stage', {'stage': 'render'})
+                release.wait(5)
+            return {'thumbnail_url': '/thumbnails/x.jpg'}
+
+        job = self.queue.submit('render', work)
+        remote = self.other_queue.get(job.id)
+        self.assertIsInstance(remote, StoredJob)
+        self.assertIn(remote.status, ('queued', 'running'))
+        self.assertEqual(remote.wait_for_events(0, timeout=1)[0][0], 'queued')
+
+        release.set()
+        wait_for(job)
+        events = self.other_queue.get(job.id).wait_for_events(2, timeout=1)
+        self.assertEqual(events[-1], ('done', {'thumbnail_url': '/thumbnails/x.jpg'}))
+
+        remote = self.other_queue.get(job.id)
+        self.assertEqual(remote.status, 'done')
+        self.assertEqual(remote.result, {'thumbnail_url': '/thumbnails/x.jpg'})
+        self.assertEqual(remote.to_dict(), job.to_dict())
+        self.assertIn('render', remote.timing()['stages'])
+        self.assertIsNone(self.other_queue.get('unknown'))
+
+if __name__ == '__main__':
+    unittest.main()
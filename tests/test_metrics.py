@@ -0,0 +1,37 @@
+import unittest
+from src.utils.metrics import MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram('stage_seconds', 'Stage time', ['stage'], buckets=(0.1, 1.0))
+        histogram.observe(0.05, stage='resize')
+        histogram.observe(0.5, stage='resize')
+        histogram.observe(5.0, stage='resize')
+        text = self.registry.render()
+        self.assertIn('# TYPE stage_seconds histogram', text)
+        self.assertIn('stage_seconds_bucket{stage="resize",le="0.1"} 1', text)
+        self.assertIn('stage_seconds_bucket{stage="resize",le="1.0"} 2', text)
+        self.assertIn('stage_seconds_bucket{stage="resize",le="+Inf"} 3', text)
+        self.assertIn('stage_seconds_count{stage="resize"} 3', text)
+
+    def test_counter_and_gauge(self):
+        counter = self.registry.counter('inferences_total', 'Inferences', ['model'])
+        counter.inc(model='resnet50')
+        counter.inc(2, model='resnet50')
+        self.registry.gauge('queue_depth', 'Queue depth', lambda: {('queued',): 4}, ['state'])
+        text = self.registry.render()
+        self.assertIn('inferences_total{model="resnet50"} 3.0', text)
+        self.assertIn('queue_depth{state="queued"} 4.0', text)
+
+    def test_labels_must_match(self):
+        counter = self.registry.counter('requests_total', 'Requests', ['endpoint'])
+        with self.assertRaises(ValueError):
+            counter.inc(stage='oops')
+
+if __name__ == '__main__':
+    unittest.main()
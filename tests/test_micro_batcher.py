@@ -0,0 +1,127 @@
+import threading
+import time
+import unittest
+from src.utils.admission import AdmissionController, OverloadedError
+from src.utils.micro_batcher import MicroBatcher
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def test_concurrent_calls_share_a_batch(self):
+        batches = []
+        release = threading.Event()
+
+        def run_batch(items):
+            batches.append(list(items))
+            release.wait(5)
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(run_batch, max_batch_size=4, max_delay=0.5)
+        results = {}
+
+        def call(value):
+            results[value] = batcher.submit(value)
+
+        threads = [threading.Thread(target=call, args=(value,)) for value in range(4)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(results, {0: 0, 1: 2, 2: 4, 3: 6})
+        self.assertEqual(sorted(item for batch in batches for item in batch), [0, 1, 2, 3])
+        self.assertLess(len(batches), 4)
+
+    def test_errors_reach_every_caller(self):
+        def run_batch(items):
+            raise RuntimeError('model failed')
+
+        batcher = MicroBatcher(run_batch, max_batch_size=4, max_delay=0.01)
+        with self.assertRaises(RuntimeError):
+            batcher.submit(1)
+
+    def test_disabled_batching_runs_inline(self):
+        callers = []
+
+        def run_batch(items):
+            callers.append(threading.current_thread())
+            return items
+
+        batcher = MicroBatcher(run_batch, max_batch_size=1)
+        self.assertEqual(batcher.submit('x'), 'x')
+        self.assertEqual(callers, [threading.current_thread()])
+
+    def test_close_runs_submitted_items_then_stops(self):
+        batcher = MicroBatcher(lambda items: [item + 1 for item in items], max_batch_size=4, max_delay=0.01)
+        self.assertEqual(batcher.submit(1), 2)
+        batcher.close()
+        self.assertFalse(any(thread.is_alive() for thread in batcher._threads))
+        with self.assertRaises(RuntimeError):
+            batcher.submit(1)
+        batcher.close()
+
+    def test_overload_is_rejected_through_the_batcher(self):
+        controller = AdmissionController()
+        controller.configure({'inference': (2, 2)}, timeout=5)
+        batch_sizes = []
+
+        def run_batch(items):
+            with controller.admit('inference'):
+                batch_sizes.append(len(items))
+                time.sleep(0.1)
+                return items
+
+        batcher = MicroBatcher(run_batch, max_batch_size=8, max_delay=0.01, workers=2,
+                               max_pending=2 * 8, timeout=5, stage='inference', controller=controller)
+        outcomes = []
+
+        def call(value):
+            try:
+                outcomes.append(batcher.submit(value) == value)
+            except OverloadedError:
+                outcomes.append('rejected')
+
+        threads = [threading.Thread(target=call, args=(value,)) for value in range(60)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        batcher.close()
+
+        self.assertIn('rejected', outcomes)
+        self.assertTrue(all(outcome in (True, 'rejected') for outcome in outcomes))
+        self.assertEqual(controller.stats()['inference']['rejected'], outcomes.count('rejected'))
+        self.assertGreater(max(batch_sizes), 2)
+
+    def test_queued_items_time_out_with_overloaded_error(self):
+        release = threading.Event()
+
+        def run_batch(items):
+            release.wait(5)
+            return items
+
+        batcher = MicroBatcher(run_batch, max_batch_size=2, max_delay=0.01, timeout=0.2, stage='inference',
+                               controller=AdmissionController())
+        outcomes = []
+
+        def call(item):
+            try:
+                outcomes.append(batcher.submit(item))
+            except OverloadedError:
+                outcomes.append('rejected')
+
+        # The first item holds the only batching thread; the second one waits behind it
+        blocker = threading.Thread(target=call, args=('first',))
+        blocker.start()
+        time.sleep(0.05)
+        start = time.monotonic()
+        with self.assertRaises(OverloadedError):
+            batcher.submit('second')
+        self.assertLess(time.monotonic() - start, 2)
+        release.set()
+        blocker.join(5)
+        batcher.close()
+
+if __name__ == '__main__':
+    unittest.main()
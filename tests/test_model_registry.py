@@ -0,0 +1,60 @@
+import threading
+import time
+import unittest
+from collections import namedtuple
+from src.ai.model_registry import ModelRegistry, model_bytes
+
+DType = namedtuple('DType', ['size'])
+Variable = namedtuple('Variable', ['shape', 'dtype'])
+
+
+class FakeModel:
+    weights = [Variable((3, 3, 16), DType(4)), Variable((16,), DType(4))]
+
+
+class TestModelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = ModelRegistry()
+
+    def test_concurrent_gets_load_once(self):
+        loads = []
+
+        def loader():
+            loads.append(1)
+            time.sleep(0.05)
+            return FakeModel()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.registry.get('fake', loader)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(loads, [1])
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_registered_loaders_and_stats(self):
+        self.registry.register('fake', FakeModel)
+        self.registry.register('missing', lambda: None)
+        self.assertFalse(self.registry.loaded('fake'))
+        self.assertEqual(self.registry.stats()['fake'], {'loaded': False})
+
+        self.registry.get('fake')
+        self.assertIsNone(self.registry.get('missing'))
+        stats = self.registry.stats()
+        self.assertEqual(stats['fake']['bytes'], (3 * 3 * 16 + 16) * 4)
+        self.assertTrue(stats['fake']['available'])
+        self.assertFalse(stats['missing']['available'])
+
+        with self.assertRaises(KeyError):
+            self.registry.get('unknown')
+
+    def test_model_bytes_without_weights(self):
+        self.assertIsNone(model_bytes(object()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from src.ai.render_plan import RenderPlanCache, compile_template, parse_color
+
+
+def make_template(opacity=0.3):
+    return {
+        'name': 'Test',
+        'layout': {
+            'textAreas': [{'x': 10, 'y': 10, 'color': '#FFFFFF', 'strokeColor': '#000000'}],
+            'elements': [
+                {'type': 'arrow', 'x': 20, 'y': 20, 'rotation': 45, 'color': '#FF0000', 'size': 20},
+                {'type': 'overlay', 'opacity': opacity, 'color': '#000000'}
+            ]
+        }
+    }
+
+
+class TestRenderPlan(unittest.TestCase):
+
+    def test_parse_color(self):
+        self.assertEqual(parse_color('#FF8000'), (255, 128, 0))
+        self.assertEqual(parse_color((1, 2, 3)), (1, 2, 3))
+        self.assertEqual(parse_color('red'), 'red')
+
+    def test_compile_template(self):
+        plan = compile_template(make_template(), (64, 36))
+        self.assertEqual(plan.overlay.size, (64, 36))
+        self.assertEqual(plan.overlay.getpixel((0, 0)), (0, 0, 0, 76))
+        self.assertEqual(len(plan.arrows), 1)
+        self.assertEqual(plan.arrows[0].color, (255, 0, 0))
+        self.assertEqual(plan.text_areas[0]['strokeColor'], (0, 0, 0))
+
+    def test_compile_template_scales_to_canvas(self):
+        full = compile_template(make_template(), (1280, 720))
+        preview = compile_template(make_template(), (320, 180))
+        self.assertEqual((full.arrows[0].x, full.arrows[0].size), (20, 20))
+        self.assertEqual((preview.arrows[0].x, preview.arrows[0].y, preview.arrows[0].size), (5, 5, 5))
+        self.assertEqual(full.text_areas[0]['fontSize'], 60)
+        self.assertEqual(preview.text_areas[0]['fontSize'], 15)
+        self.assertEqual(preview.text_areas[0]['strokeWidth'], 1)
+
+    def test_cache_reuses_and_invalidates_plans(self):
+        cache = RenderPlanCache()
+        plan = cache.get(make_template(), (64, 36), 'v1')
+        self.assertIs(cache.get(make_template(), (64, 36), 'v1'), plan)
+        self.assertIsNot(cache.get(make_template(), (32, 18), 'v1'), plan)
+
+        changed = cache.get(make_template(opacity=0.5), (64, 36), 'v2')
+        self.assertIsNot(changed, plan)
+        self.assertIsNot(changed.overlay, None)
+        self.assertNotEqual(changed.overlay.getpixel((0, 0)), plan.overlay.getpixel((0, 0)))
+
+    def test_cache_compiles_unversioned_templates_once(self):
+        cache = RenderPlanCache()
+        plan = cache.get(make_template(), (64, 36))
+        self.assertIs(cache.get(make_template(), (64, 36)), plan)
+
+if __name__ == '__main__':
+    unittest.main()
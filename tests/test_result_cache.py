@@ -0,0 +1,71 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from PIL import Image
+from src.utils.result_cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = ResultCache(self.cache_dir)
+        self.image = Image.new('RGB', (32, 18), color='red')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_key_ignores_reasoning(self):
+        key_a = ResultCache.make_key(b'img', {'style': 'gaming', 'style_reasoning': 'a'})
+        key_b = ResultCache.make_key(b'img', {'style': 'gaming', 'style_reasoning': 'b'})
+        key_c = ResultCache.make_key(b'img', {'style': 'vlog'})
+        self.assertEqual(key_a, key_b)
+        self.assertNotEqual(key_a, key_c)
+
+    def test_key_changes_with_template_version(self):
+        key_a = ResultCache.make_key(b'img', template_name='Gaming', template_version='a')
+        key_b = ResultCache.make_key(b'img', template_name='Gaming', template_version='b')
+        self.assertNotEqual(key_a, key_b)
+
+    def test_hit_and_miss_counters(self):
+        self.assertIsNone(self.cache.get('k'))
+        self.cache.put('k', self.image)
+        self.assertEqual(self.cache.get('k').size, (32, 18))
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_disk_tier_survives_restart(self):
+        self.cache.put('k', self.image)
+        reopened = ResultCache(self.cache_dir)
+        self.assertIsNotNone(reopened.get('k'))
+        self.assertEqual(reopened.stats()['disk_hits'], 1)
+
+    def test_memory_lru_eviction(self):
+        cache = ResultCache(self.cache_dir, max_memory_bytes=32 * 18 * 3 * 2)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, self.image)
+        self.assertEqual(cache.stats()['memory_entries'], 2)
+
+    def test_concurrent_requests_are_coalesced(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return self.image
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_compute('k', compute)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from src.ai.template_registry import TemplateError, TemplateRegistry, validate_template
+
+
+def make_template(name, styles=(), tones=()):
+    return {
+        'name': name,
+        'styles': list(styles),
+        'tones': list(tones),
+        'layout': {
+            'textAreas': [{'x': 640, 'y': 120}],
+            'elements': [{'type': 'overlay', 'opacity': 0.3, 'color': '#000000'}]
+        }
+    }
+
+
+class TestTemplateRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('a_default.json', make_template('Default'))
+        self.write('b_gaming.json', make_template('Gaming', styles=['gaming']))
+        self.write('c_shocked.json', make_template('Shocked', styles=['gaming', 'reaction'], tones=['shocked']))
+        self.registry = TemplateRegistry(self.directory, check_interval=0, default_name='Default')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, filename, template):
+        path = os.path.join(self.directory, filename)
+        with open(path, 'w') as f:
+            json.dump(template, f)
+        return path
+
+    def test_select_by_style_and_tone(self):
+        self.assertEqual(self.registry.select('gaming')['name'], 'Gaming')
+        self.assertEqual(self.registry.select('gaming', 'shocked')['name'], 'Shocked')
+        self.assertEqual(self.registry.select('reaction', 'excited')['name'], 'Shocked')
+        self.assertEqual(self.registry.select('vlog', 'shocked')['name'], 'Shocked')
+        self.assertEqual(self.registry.select('vlog', 'funny')['name'], 'Default')
+        self.assertEqual(self.registry.path('Gaming'), os.path.join(self.directory, 'b_gaming.json'))
+
+    def test_reloads_changed_files(self):
+        gaming = self.registry.get('Gaming')
+        self.write('d_vlog.json', make_template('Vlog', styles=['vlog']))
+        path = self.write('b_gaming.json', make_template('Gaming', styles=['gaming'], tones=['excited']))
+        os.utime(path, ns=(0, 0))
+        version = self.registry.version('Gaming')
+
+        self.assertTrue(self.registry.reload())
+        self.assertEqual(self.registry.select('vlog')['name'], 'Vlog')
+        self.assertNotEqual(self.registry.version('Gaming'), version)
+        self.assertIsNot(self.registry.get('Gaming'), gaming)
+        self.assertIs(self.registry.get('Default'), self.registry.select())
+
+        os.remove(path)
+        self.registry.reload()
+        self.assertNotIn('Gaming', self.registry)
+        self.assertEqual(self.registry.select('gaming')['name'], 'Shocked')
+
+    def test_invalid_templates_are_skipped(self):
+        self.write('e_broken.json', {'name': 'Broken', 'layout': {'elements': [{'type': 'arrow'}]}})
+        self.assertTrue(self.registry.reload())
+        self.assertNotIn('Broken', self.registry)
+        self.assertEqual(len(self.registry), 3)
+        with self.assertRaises(TemplateError):
+            validate_template({'name': 'Bad', 'layout': {'elements': []}, 'styles': 'gaming'})
+
+    def test_watcher_picks_up_changes(self):
+        registry = TemplateRegistry(self.directory, check_interval=0.01, default_name='Default')
+        try:
+            self.write('d_vlog.json', make_template('Vlog', styles=['vlog']))
+            deadline = time.time() + 5
+            while 'Vlog' not in registry and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertIn('Vlog', registry)
+            self.assertNotIn('Vlog', self.registry)
+        finally:
+            registry.stop()
+
+if __name__ == '__main__':
+    unittest.main()